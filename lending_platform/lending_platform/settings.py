@@ -1,8 +1,11 @@
 import os
+from pathlib import Path
 from dotenv import load_dotenv
 
 load_dotenv()
 
+BASE_DIR = Path(__file__).resolve().parent.parent
+
 INSTALLED_APPS = [
     'django.contrib.admin',
     'django.contrib.auth',
@@ -11,6 +14,7 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'rest_framework',
+    'rest_framework.authtoken',
     'corsheaders',
     'loans',
     'zeep',
@@ -34,9 +38,12 @@ TEMPLATES = [
 ]
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.BasicAuthentication',
+        'loans.authentication.CachedTokenAuthentication',
+        'loans.authentication.CachedBasicAuthentication',
     ],
 }
+# How long a verified credential skips the password hasher / token lookup
+AUTH_CACHE_TIMEOUT = int(os.getenv('AUTH_CACHE_TIMEOUT', 300))  # Default: 5 minutes
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',  
     'django.middleware.security.SecurityMiddleware',
@@ -57,6 +64,55 @@ DATABASES = {
         'PORT': os.getenv('DB_PORT', '5432'),
     }
 }
+# Shared cache (L2): Redis when REDIS_URL is set, otherwise the database
+# (run `python manage.py createcachetable` once). The database cache culls a
+# third of its rows, in key order, once it holds MAX_ENTRIES; size it well
+# above the working set or auth, rule and KYC entries get evicted together
+REDIS_URL = os.getenv('REDIS_URL')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': 'loans_cache',
+            'OPTIONS': {
+                'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', 1000000)),
+            },
+        }
+    }
+
+# In-process LRU (L1) in front of the shared cache
+TIERED_CACHE_L1_MAX_ENTRIES = int(os.getenv('TIERED_CACHE_L1_MAX_ENTRIES', 2048))
+TIERED_CACHE_L1_TIMEOUT = int(os.getenv('TIERED_CACHE_L1_TIMEOUT', 60))  # seconds
+TIERED_CACHE_SYNC_INTERVAL = float(os.getenv('TIERED_CACHE_SYNC_INTERVAL', 1))  # seconds between invalidation checks
+TIERED_CACHE_LOG_SIZE = int(os.getenv('TIERED_CACHE_LOG_SIZE', 1000))  # Invalidations a worker may lag before clearing L1
+TIERED_CACHE_LOG_TIMEOUT = int(os.getenv('TIERED_CACHE_LOG_TIMEOUT', 300))  # seconds
+
+# KYC is served stale-while-revalidate: refreshed in the background after the
+# soft TTL (earlier, at random, as it nears) and dropped after the hard TTL
+KYC_CACHE_SOFT_TIMEOUT = int(os.getenv('KYC_CACHE_SOFT_TIMEOUT', 3600))  # Default: 1 hour
+KYC_CACHE_HARD_TIMEOUT = int(os.getenv('KYC_CACHE_HARD_TIMEOUT', 86400))  # Default: 1 day
+KYC_CACHE_BETA = float(os.getenv('KYC_CACHE_BETA', 1.0))  # >1 refreshes earlier
+# Stored CustomerProfile rows answer KYC lookups until they are this old; only then is CBS asked
+KYC_PROFILE_MAX_AGE = int(os.getenv('KYC_PROFILE_MAX_AGE', 86400))  # Default: 1 day
+# Customers CBS reports as unknown are remembered for this long (CBS errors are never cached)
+CBS_NOT_FOUND_CACHE_TIMEOUT = int(os.getenv('CBS_NOT_FOUND_CACHE_TIMEOUT', 300))  # Default: 5 minutes
+# CBS reports an unknown customer as a SOAP fault whose faultstring matches this
+# (case-insensitive); any other fault is a CBS error
+CBS_NOT_FOUND_FAULT = os.getenv('CBS_NOT_FOUND_FAULT', r'customer.*not found')
+
+# LoanStatusAPI responses are dropped on every LoanApplication change. A read
+# racing a change can still re-cache the old status, so only final statuses
+# (REJECTED, FAILED, REPAID) are kept long
+LOAN_STATUS_CACHE_TIMEOUT = int(os.getenv('LOAN_STATUS_CACHE_TIMEOUT', 86400))  # Default: 1 day
+LOAN_STATUS_ACTIVE_CACHE_TIMEOUT = int(os.getenv('LOAN_STATUS_ACTIVE_CACHE_TIMEOUT', 5))  # Default: 5 seconds
+
 STATIC_URL = '/static/'
 TIME_ZONE = os.getenv('TIME_ZONE', 'Africa/Nairobi')
 SECRET_KEY = os.getenv('SECRET_KEY', 't+zlp_hmj0uro^3kye(w-c#$nz(ojf6umu_h-z-0m2gtun2544')
@@ -81,14 +137,99 @@ SERVICE_NAME = os.getenv('SERVICE_NAME', 'DigitalLendingPlatform')
 SERVICE_USERNAME = os.getenv('SERVICE_USERNAME', 'lending_user')
 SERVICE_PASSWORD = os.getenv('SERVICE_PASSWORD', 'lending_pass123')
 BASE_URL = os.getenv('BASE_URL', 'http://localhost:8000')
+# After `register_client --rotate`, older client tokens stay usable this long
+CLIENT_TOKEN_ROTATION_OVERLAP = int(os.getenv('CLIENT_TOKEN_ROTATION_OVERLAP', 3600))  # Default: 1 hour
+CLIENT_REGISTRATION_CACHE_TIMEOUT = int(os.getenv('CLIENT_REGISTRATION_CACHE_TIMEOUT', 3600))  # Dropped on every change
 # settings.py
 # Retry settings for Scoring Engine
 SCORING_MAX_RETRIES = int(os.getenv('SCORING_MAX_RETRIES', 3))  # Default: 3 retries
 SCORING_RETRY_DELAY = int(os.getenv('SCORING_RETRY_DELAY', 2))  # Default: 2 seconds
-SCORING_TIMEOUT = int(os.getenv('SCORING_TIMEOUT', 10))  # Default: 10 seconds
+SCORING_TIMEOUT = int(os.getenv('SCORING_TIMEOUT', 10))  # Default: 10 seconds (read)
+SCORING_CONNECT_TIMEOUT = int(os.getenv('SCORING_CONNECT_TIMEOUT', 3))  # Default: 3 seconds
+# Approval rules used while no DecisionRuleSet row is active (version 0)
+LOAN_DECISION_RULES = {
+    'min_score': 500,
+    'max_amount_ratio': 1,  # Requested amount as a share of the credit limit
+    'allowed_exclusions': ['No Exclusion'],
+    'interest_rate': 12.5,
+    'term_days': 30,
+}
+DECISION_RULES_CACHE_TIMEOUT = int(os.getenv('DECISION_RULES_CACHE_TIMEOUT', 3600))  # Dropped on every change
+PRICING_CACHE_TIMEOUT = int(os.getenv('PRICING_CACHE_TIMEOUT', 3600))  # Dropped on every change
+# A customer's score is reused for new applications this long; 0 always asks the Scoring Engine
+SCORE_REUSE_TIMEOUT = int(os.getenv('SCORE_REUSE_TIMEOUT', 600))  # Default: 10 minutes
+
+# Loan decisioning: 'sync' scores inside the request, 'async' returns 202
+# and finishes scoring on a background executor
+LOAN_DECISION_MODE = os.getenv('LOAN_DECISION_MODE', 'sync')
+LOAN_DECISION_WORKERS = int(os.getenv('LOAN_DECISION_WORKERS', 8))  # Background threads per process
+# `manage.py sweep_loans` fails PENDING/PROCESSING applications unchanged this long
+LOAN_DECISION_TIMEOUT = int(os.getenv('LOAN_DECISION_TIMEOUT', 3600))  # Default: 1 hour
+# Background decisions lost to a restart are queued again after this long (by sweep_loans and poll_scores)
+LOAN_RESUBMIT_AFTER = int(os.getenv('LOAN_RESUBMIT_AFTER', 300))  # Default: 5 minutes
+# 'inline' polls queryScore in the background worker, 'poller' leaves it to `manage.py poll_scores`
+SCORE_POLLING_MODE = os.getenv('SCORE_POLLING_MODE', 'inline')
+
+# Score poller (`manage.py poll_scores`)
+SCORE_POLLER_CONCURRENCY = int(os.getenv('SCORE_POLLER_CONCURRENCY', 50))  # queryScore calls in flight
+SCORE_POLLER_BATCH_SIZE = int(os.getenv('SCORE_POLLER_BATCH_SIZE', 200))  # Decisions per write
+SCORE_POLLER_FLUSH_INTERVAL = float(os.getenv('SCORE_POLLER_FLUSH_INTERVAL', 1))  # seconds
+SCORE_POLLER_REFRESH_INTERVAL = float(os.getenv('SCORE_POLLER_REFRESH_INTERVAL', 5))  # seconds between DB scans
+SCORE_POLLER_BASE_DELAY = float(os.getenv('SCORE_POLLER_BASE_DELAY', 1))  # seconds
+SCORE_POLLER_MAX_DELAY = float(os.getenv('SCORE_POLLER_MAX_DELAY', 60))  # seconds
+SCORE_POLLER_MAX_ATTEMPTS = int(os.getenv('SCORE_POLLER_MAX_ATTEMPTS', 20))
+
+# Bulk subscription (`subscribe/bulk/` and `manage.py bulk_subscribe`)
+BULK_SUBSCRIPTION_CONCURRENCY = int(os.getenv('BULK_SUBSCRIPTION_CONCURRENCY', 8))  # KYC lookups in flight
+BULK_SUBSCRIPTION_BATCH_SIZE = int(os.getenv('BULK_SUBSCRIPTION_BATCH_SIZE', 500))  # Subscriptions per upsert
+BULK_SUBSCRIPTION_MAX_CUSTOMERS = int(os.getenv('BULK_SUBSCRIPTION_MAX_CUSTOMERS', 10000))  # Per API request
+
+# Decision backtesting (`manage.py backtest_decisions`)
+BACKTEST_CHUNK_SIZE = int(os.getenv('BACKTEST_CHUNK_SIZE', 50000))  # Applications per evaluated chunk
+BACKTEST_WORKERS = int(os.getenv('BACKTEST_WORKERS', 0)) or None  # Processes; default: one per CPU
 
 # CBS SOAP Timeout
-CBS_TIMEOUT = int(os.getenv('CBS_TIMEOUT', 15))  # Default: 15 seconds
+CBS_TIMEOUT = int(os.getenv('CBS_TIMEOUT', 15))  # Default: 15 seconds (read)
+CBS_CONNECT_TIMEOUT = int(os.getenv('CBS_CONNECT_TIMEOUT', 3))  # Default: 3 seconds
+# Concurrent KYC/transaction misses share one CBS call per process; with
+# CBS_SINGLE_FLIGHT_SHARED the leader also locks and publishes in the shared cache
+CBS_SINGLE_FLIGHT_SHARED = os.getenv('CBS_SINGLE_FLIGHT_SHARED', 'True') == 'True'
+CBS_SINGLE_FLIGHT_RESULT_TIMEOUT = int(os.getenv('CBS_SINGLE_FLIGHT_RESULT_TIMEOUT', 5))  # seconds
+
+# Outbound HTTP connection pools (per dependency, per host)
+HTTP_POOL_CONNECTIONS = int(os.getenv('HTTP_POOL_CONNECTIONS', 10))  # Hosts kept pooled
+HTTP_POOL_MAXSIZE = int(os.getenv('HTTP_POOL_MAXSIZE', 20))  # Keep-alive connections per host
+HTTP_POOL_BLOCK = os.getenv('HTTP_POOL_BLOCK', 'False') == 'True'
+HTTP_CONNECT_TIMEOUT = int(os.getenv('HTTP_CONNECT_TIMEOUT', 3))
+HTTP_READ_TIMEOUT = int(os.getenv('HTTP_READ_TIMEOUT', 10))
+# Each process logs its outbound call counters (loans.http) at most this often; 0 disables
+HTTP_METRICS_LOG_INTERVAL = int(os.getenv('HTTP_METRICS_LOG_INTERVAL', 300))  # Default: 5 minutes
+
+# Circuit breaker per outbound dependency (cbs, scoring), per process
+CIRCUIT_BREAKER_WINDOW = int(os.getenv('CIRCUIT_BREAKER_WINDOW', 30))  # seconds of outcomes considered
+CIRCUIT_BREAKER_BUCKETS = int(os.getenv('CIRCUIT_BREAKER_BUCKETS', 10))
+CIRCUIT_BREAKER_MIN_CALLS = int(os.getenv('CIRCUIT_BREAKER_MIN_CALLS', 10))  # Calls in the window before it can open
+CIRCUIT_BREAKER_FAILURE_RATE = float(os.getenv('CIRCUIT_BREAKER_FAILURE_RATE', 0.5))
+CIRCUIT_BREAKER_OPEN_SECONDS = int(os.getenv('CIRCUIT_BREAKER_OPEN_SECONDS', 30))  # Fail fast this long before probing
+CIRCUIT_BREAKER_HALF_OPEN_CALLS = int(os.getenv('CIRCUIT_BREAKER_HALF_OPEN_CALLS', 1))
+
+# Last good KYC per customer, served (flagged stale) while CBS is unavailable
+CBS_STALE_CACHE_TIMEOUT = int(os.getenv('CBS_STALE_CACHE_TIMEOUT', 604800))  # Default: 7 days
+
+# CBS transactions are copied into CustomerTransaction at most this often per customer
+TRANSACTION_SYNC_INTERVAL = int(os.getenv('TRANSACTION_SYNC_INTERVAL', 3600))  # Default: 1 hour
+TRANSACTION_SYNC_BATCH_SIZE = int(os.getenv('TRANSACTION_SYNC_BATCH_SIZE', 1000))  # Rows written per insert while streaming
+# Transactions dated up to this long before an account's last synced one are re-read each sync
+TRANSACTION_SYNC_LOOKBACK = int(os.getenv('TRANSACTION_SYNC_LOOKBACK', 7 * 86400))  # Default: 7 days
+TRANSACTION_PAGE_SIZE = int(os.getenv('TRANSACTION_PAGE_SIZE', 500))  # Default page when a cursor is given without page_size
+TRANSACTION_PAGE_MAX_SIZE = int(os.getenv('TRANSACTION_PAGE_MAX_SIZE', 5000))
+TRANSACTION_STREAM_CHUNK_SIZE = int(os.getenv('TRANSACTION_STREAM_CHUNK_SIZE', 2000))  # Rows fetched per round trip when streaming
+
+# Local copy of CBS WSDL/XSD documents, shared by all workers on the host
+CBS_WSDL_CACHE_DIR = os.getenv('CBS_WSDL_CACHE_DIR', str(BASE_DIR / '.wsdl_cache'))
+CBS_WSDL_CACHE_TIMEOUT = int(os.getenv('CBS_WSDL_CACHE_TIMEOUT', 0))  # Default: never expire, refresh explicitly
+# Bundle written by `manage.py compile_wsdl_bundle`; when present clients load from it at startup
+CBS_WSDL_BUNDLE_DIR = os.getenv('CBS_WSDL_BUNDLE_DIR', str(BASE_DIR / 'wsdl_bundle'))
 # settings.py
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:3000",  # Mobile App dev server
@@ -1,6 +1,17 @@
+import logging
 from django.apps import AppConfig
 
+logger = logging.getLogger(__name__)
+
 
 class LoansConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'loans'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from .services import CBSService
+        try:
+            CBSService.preload_clients()
+        except Exception as e:
+            logger.error(f"Could not load CBS clients from WSDL bundle: {str(e)}")
@@ -0,0 +1,68 @@
+import hmac
+import hashlib
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from rest_framework.authentication import BasicAuthentication, TokenAuthentication
+
+from .cache import cache
+
+
+def _digest(value):
+    return hmac.new(settings.SECRET_KEY.encode('utf-8'), value.encode('utf-8'), hashlib.sha256).hexdigest()
+
+
+def token_cache_key(key):
+    return f"auth:token:{_digest(key)}"
+
+
+def _active_user(pk):
+    try:
+        user = get_user_model().objects.get(pk=pk)
+    except get_user_model().DoesNotExist:
+        return None
+    return user if user.is_active else None
+
+
+class CachedBasicAuthentication(BasicAuthentication):
+    """
+    Basic auth that runs the password hasher once per AUTH_CACHE_TIMEOUT.
+
+    The cache maps an HMAC of the submitted username/password to the user
+    and a digest of their stored password hash. A password change or
+    deactivation therefore revokes the cached credential on the next request.
+    """
+    def authenticate_credentials(self, userid, password, request=None):
+        key = f"auth:basic:{_digest(f'{userid}:{password}')}"
+        cached = cache.get(key)
+        if cached:
+            user_pk, password_digest = cached
+            user = _active_user(user_pk)
+            if user and hmac.compare_digest(password_digest, _digest(user.password)):
+                return (user, None)
+            cache.delete(key)
+
+        user, auth = super().authenticate_credentials(userid, password, request)
+        cache.fill(key, (user.pk, _digest(user.password)), settings.AUTH_CACHE_TIMEOUT)
+        return (user, auth)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    `Authorization: Token <key>` for service clients, with the verified key
+    cached; deleting the Token revokes it (see loans.signals).
+
+    `request.auth` is a Token either way. On a cache hit it is built from the
+    key (the Token's primary key) without a query, so `created` is unset.
+    """
+    def authenticate_credentials(self, key):
+        cache_key = token_cache_key(key)
+        user_pk = cache.get(cache_key)
+        if user_pk:
+            user = _active_user(user_pk)
+            if user:
+                return (user, self.get_model()(key=key, user=user))
+            cache.delete(cache_key)
+
+        user, token = super().authenticate_credentials(key)
+        cache.fill(cache_key, user.pk, settings.AUTH_CACHE_TIMEOUT)
+        return (user, token)
@@ -0,0 +1,151 @@
+import os
+import logging
+from decimal import Decimal
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+import django
+import numpy as np
+from django.conf import settings
+
+from .decisions import decision_engine
+from .models import LoanApplication
+
+logger = logging.getLogger(__name__)
+
+# Statuses an application can only reach by having been approved
+APPROVED_STATUSES = ('APPROVED', 'DISBURSED', 'REPAID')
+DECIDED_STATUSES = APPROVED_STATUSES + ('REJECTED',)
+
+
+class CandidateTotals:
+    __slots__ = ('label', 'rule_set', 'approved', 'exposure', 'newly_approved', 'newly_rejected')
+
+    def __init__(self, label, rule_set):
+        self.label = label
+        self.rule_set = rule_set
+        self.approved = 0
+        self.exposure = 0  # cents
+        self.newly_approved = 0
+        self.newly_rejected = 0
+
+
+class BacktestResult:
+    """
+    Running totals for the historical decisions and every candidate
+    """
+    def __init__(self, candidates):
+        self.applications = 0
+        self.approved = 0
+        self.exposure = 0  # cents
+        self.candidates = [CandidateTotals(label, rule_set) for label, rule_set in candidates]
+
+    def add(self, totals):
+        applications, approved, exposure, candidates = totals
+        self.applications += applications
+        self.approved += approved
+        self.exposure += exposure
+        for candidate, (approved, exposure, newly_approved, newly_rejected) in zip(self.candidates, candidates):
+            candidate.approved += approved
+            candidate.exposure += exposure
+            candidate.newly_approved += newly_approved
+            candidate.newly_rejected += newly_rejected
+
+    def rate(self, approved):
+        return approved / self.applications if self.applications else 0.0
+
+    @staticmethod
+    def amount(cents):
+        return Decimal(cents).scaleb(-2)
+
+
+def evaluate_chunk(columns, rule_sets):
+    """
+    Runs in a pool process: decides one chunk under every rule set and
+    returns only the totals, so no per-application data travels back
+    """
+    scores, credit_limits, exclusions, requested_amounts, approved = columns
+    amount_cents = np.rint(requested_amounts * 100).astype(np.int64)
+    candidates = []
+    for rule_set in rule_sets:
+        decided = decision_engine.decide_batch(
+            scores, credit_limits, exclusions, requested_amounts, rule_set=rule_set
+        )
+        candidates.append((
+            int(decided.sum()),
+            int(amount_cents[decided].sum()),
+            int((decided & ~approved).sum()),
+            int((approved & ~decided).sum()),
+        ))
+    return len(scores), int(approved.sum()), int(amount_cents[approved].sum()), candidates
+
+
+class Backtester:
+    """
+    Replays decided loan applications through candidate rule sets.
+
+    Applications are read through a server-side cursor and evaluated in
+    chunks of `chunk_size` on a pool of `workers` processes. At most two
+    chunks per worker are queued and each returns only totals, so memory
+    stays bounded however many applications there are.
+    """
+    def __init__(self, candidates, workers=None, chunk_size=None):
+        self.candidates = list(candidates)  # (label, RuleSet) pairs
+        self.workers = workers or settings.BACKTEST_WORKERS or os.cpu_count()
+        self.chunk_size = chunk_size or settings.BACKTEST_CHUNK_SIZE
+
+    @staticmethod
+    def applications(since=None, until=None):
+        queryset = LoanApplication.objects.filter(
+            status__in=DECIDED_STATUSES,
+            score__isnull=False
+        )
+        if since:
+            queryset = queryset.filter(created_at__date__gte=since)
+        if until:
+            queryset = queryset.filter(created_at__date__lte=until)
+        return queryset.values_list('score', 'credit_limit', 'exclusion', 'requested_amount', 'status')
+
+    def run(self, applications):
+        result = BacktestResult(self.candidates)
+        rule_sets = [rule_set for _, rule_set in self.candidates]
+        # Pool processes may be spawned rather than forked; they only need
+        # the app registry, never a database connection
+        with ProcessPoolExecutor(max_workers=self.workers, initializer=django.setup) as executor:
+            in_flight = set()
+            for columns in self._chunks(applications):
+                if len(in_flight) >= self.workers * 2:
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    self._collect(done, result)
+                in_flight.add(executor.submit(evaluate_chunk, columns, rule_sets))
+
+            while in_flight:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                self._collect(done, result)
+        return result
+
+    def _chunks(self, applications):
+        rows = []
+        # iterator() streams from a server-side cursor on PostgreSQL
+        for row in applications.iterator(chunk_size=self.chunk_size):
+            rows.append(row)
+            if len(rows) >= self.chunk_size:
+                yield self._columns(rows)
+                rows = []
+        if rows:
+            yield self._columns(rows)
+
+    @staticmethod
+    def _columns(rows):
+        scores, credit_limits, exclusions, requested_amounts, statuses = zip(*rows)
+        return (
+            np.asarray(scores, dtype=np.float64),
+            np.asarray(credit_limits, dtype=np.float64),
+            np.asarray(exclusions, dtype=object),
+            np.asarray(requested_amounts, dtype=np.float64),
+            np.isin(np.asarray(statuses, dtype=object), APPROVED_STATUSES),
+        )
+
+    @staticmethod
+    def _collect(done, result):
+        for future in done:
+            result.add(future.result())
+        logger.debug(f"Backtested {result.applications} applications")
@@ -0,0 +1,134 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+
+from .cache import kyc_cache
+from .models import CustomerSubscription, LoanApplication
+from .services import CBSError, CustomerProfileService
+
+logger = logging.getLogger(__name__)
+
+
+class BulkSubscriber:
+    """
+    Subscribes many customers at once.
+
+    KYC lookups run concurrently (at most `concurrency` at a time) through
+    the same cache as the single subscription API. Customers CBS knows are
+    upserted in batches of `batch_size`, one INSERT ... ON CONFLICT each.
+    `run` yields one result per customer: misses and errors as soon as they
+    are known, subscriptions once their batch is written.
+    """
+    def __init__(self, concurrency=None, batch_size=None):
+        self.concurrency = concurrency or settings.BULK_SUBSCRIPTION_CONCURRENCY
+        self.batch_size = batch_size or settings.BULK_SUBSCRIPTION_BATCH_SIZE
+        self.counts = {'SUBSCRIBED': 0, 'NOT_FOUND': 0, 'ERROR': 0}
+
+    def run(self, customer_numbers):
+        batch = []
+        # The database connection of each worker thread, kept for the whole run
+        thread_connections = set()
+        try:
+            with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='bulk-subscribe') as executor:
+                in_flight = set()
+                for customer_number in self._unique(customer_numbers):
+                    # Only a small window is ever queued, whatever the input size
+                    if len(in_flight) >= self.concurrency * 2:
+                        done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                        yield from self._collect(done, batch)
+                    in_flight.add(executor.submit(self._lookup, customer_number, thread_connections))
+
+                while in_flight:
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    yield from self._collect(done, batch)
+        finally:
+            self._close(thread_connections)
+        yield from self._flush(batch)
+
+    @staticmethod
+    def _close(thread_connections):
+        # Called once the pool has shut down, so no thread still uses them
+        for wrapper in thread_connections:
+            wrapper.inc_thread_sharing()
+            try:
+                wrapper.close()
+            finally:
+                wrapper.dec_thread_sharing()
+
+    def _unique(self, customer_numbers):
+        seen = set()
+        for customer_number in customer_numbers:
+            customer_number = (customer_number or '').strip()
+            if customer_number and customer_number not in seen:
+                seen.add(customer_number)
+                yield customer_number
+
+    def _lookup(self, customer_number, thread_connections):
+        # The cache may use the database; each worker thread keeps one
+        # connection for the run instead of reconnecting per customer
+        thread_connections.add(connections[DEFAULT_DB_ALIAS])
+        try:
+            kyc_data = kyc_cache.get(
+                f"kyc_{customer_number}",
+                lambda: CustomerProfileService.get_kyc(customer_number)
+            )
+            return customer_number, kyc_data, None
+        except CBSError:
+            return customer_number, None, "Core banking system unavailable"
+        except Exception as e:
+            logger.error(f"Bulk subscription lookup error for {customer_number}: {str(e)}")
+            # Don't carry a broken connection into the next lookup
+            connection.close()
+            return customer_number, None, "Internal server error"
+
+    def _collect(self, done, batch):
+        for future in done:
+            customer_number, kyc_data, error = future.result()
+            if error:
+                yield self._result(customer_number, 'ERROR', error=error)
+            elif not kyc_data:
+                yield self._result(customer_number, 'NOT_FOUND', error="Customer not found in CBS")
+            else:
+                batch.append((customer_number, kyc_data))
+                if len(batch) >= self.batch_size:
+                    yield from self._flush(batch)
+
+    def _flush(self, batch):
+        if not batch:
+            return
+        entries, batch[:] = list(batch), []
+        customer_numbers = [customer_number for customer_number, _ in entries]
+        # Existing subscriptions keep their is_active flag, as with get_or_create
+        CustomerSubscription.objects.bulk_create(
+            [
+                CustomerSubscription(customer_number=customer_number, is_active=True)
+                for customer_number in customer_numbers
+            ],
+            update_conflicts=True,
+            unique_fields=['customer_number'],
+            update_fields=['last_updated']
+        )
+        subscription_ids = dict(CustomerSubscription.objects.filter(
+            customer_number__in=customer_numbers
+        ).values_list('customer_number', 'id'))
+        # The KYC may have come from the cache, so only fill in missing profiles
+        CustomerProfileService.store([
+            (subscription_ids[customer_number], kyc_data) for customer_number, kyc_data in entries
+        ], replace=False)
+        with_loans = set(LoanApplication.objects.filter(
+            customer_number__in=customer_numbers,
+            status__in=LoanApplication.ACTIVE_STATUSES
+        ).values_list('customer_number', flat=True))
+        for customer_number, kyc_data in entries:
+            yield self._result(
+                customer_number,
+                'SUBSCRIBED',
+                name=kyc_data.customer_name,
+                accountStatus=kyc_data.account_status,
+                existingLoan=customer_number in with_loans
+            )
+
+    def _result(self, customer_number, result_status, **fields):
+        self.counts[result_status] += 1
+        return {"customerNumber": customer_number, "status": result_status, **fields}
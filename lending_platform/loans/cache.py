@@ -0,0 +1,403 @@
+import math
+import time
+import random
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection, transaction
+
+from .records import SchemaMismatch, kyc_codec
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+# Tombstone cached for lookups the upstream answered with "not found"
+NOT_FOUND = '__not_found__'
+
+
+def is_not_found(value):
+    return isinstance(value, str) and value == NOT_FOUND
+
+
+class LocalLRU:
+    """
+    Bounded in-process cache with per-entry expiry
+    """
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return _MISSING
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return _MISSING
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + timeout)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class TieredCache:
+    """
+    Small in-process LRU (L1) in front of the shared Django cache (L2).
+
+    Every write or delete is appended to an invalidation log kept in L2.
+    Each worker reads the log at most once per `sync_interval` and drops the
+    listed keys from its L1, so a change made by one worker reaches every
+    other worker's L1 within that interval. Read-through fills after a miss
+    go through `fill`, which skips the log: no worker holds an older copy.
+
+    L2 errors are logged and never raised: a failed read is a miss and a
+    failed write or delete only reaches L1.
+    """
+    SEQUENCE_KEY = 'tiered:invalidation:seq'
+    LOG_KEY = 'tiered:invalidation:{}'
+
+    def __init__(self, alias='default', max_entries=None, l1_timeout=None,
+                 sync_interval=None, log_size=None):
+        self.alias = alias
+        self.l1 = LocalLRU(max_entries or settings.TIERED_CACHE_L1_MAX_ENTRIES)
+        self.l1_timeout = l1_timeout or settings.TIERED_CACHE_L1_TIMEOUT
+        self.sync_interval = sync_interval or settings.TIERED_CACHE_SYNC_INTERVAL
+        self.log_size = log_size or settings.TIERED_CACHE_LOG_SIZE
+        self._seen = None
+        self._next_sync = 0
+        self._sync_lock = threading.Lock()
+
+    @property
+    def l2(self):
+        return caches[self.alias]
+
+    def get(self, key, default=None):
+        self.sync()
+        value = self.l1.get(key)
+        if value is not _MISSING:
+            return value
+        try:
+            value = self.l2.get(key, _MISSING)
+        except Exception as e:
+            # An unreachable shared cache is a miss, not an error
+            logger.error(f"Cache get failed for {key}: {str(e)}")
+            return default
+        if value is _MISSING:
+            return default
+        self.l1.set(key, value, self.l1_timeout)
+        return value
+
+    def set(self, key, value, timeout):
+        """
+        Stores a new value for `key`; other workers drop their L1 copy
+        """
+        self.fill(key, value, timeout)
+        self.broadcast([key])
+
+    def fill(self, key, value, timeout):
+        """
+        Stores a value just loaded after a miss, without broadcasting it
+        """
+        try:
+            self.l2.set(key, value, timeout)
+        except Exception as e:
+            logger.error(f"Cache set failed for {key}: {str(e)}")
+        # Kept locally either way; a failing sync() clears L1 on its own
+        self.l1.set(key, value, self.l1_timeout if timeout is None else min(timeout, self.l1_timeout))
+
+    def delete(self, key):
+        self.delete_many([key])
+
+    def delete_many(self, keys):
+        keys = list(keys)
+        if not keys:
+            return
+        try:
+            self.l2.delete_many(keys)
+        except Exception as e:
+            logger.error(f"Cache delete failed for {', '.join(keys)}: {str(e)}")
+        for key in keys:
+            self.l1.delete(key)
+        self.broadcast(keys)
+
+    def broadcast(self, keys):
+        """
+        Appends `keys` to the invalidation log read by every worker
+        """
+        try:
+            self.l2.add(self.SEQUENCE_KEY, 0, None)
+            # Not every backend increments atomically; a taken slot means
+            # another worker got the same number, so take the next one
+            for _ in range(3):
+                sequence = self.l2.incr(self.SEQUENCE_KEY)
+                if self.l2.add(self.LOG_KEY.format(sequence), list(keys), settings.TIERED_CACHE_LOG_TIMEOUT):
+                    return
+        except Exception as e:
+            logger.error(f"Cache invalidation broadcast failed: {str(e)}")
+
+    def sync(self):
+        now = time.monotonic()
+        if now < self._next_sync or not self._sync_lock.acquire(blocking=False):
+            return
+        try:
+            self._next_sync = now + self.sync_interval
+            self._sync()
+        except Exception as e:
+            logger.error(f"Cache invalidation sync failed: {str(e)}")
+            self.l1.clear()
+        finally:
+            self._sync_lock.release()
+
+    def _sync(self):
+        current = self.l2.get(self.SEQUENCE_KEY, 0)
+        seen, self._seen = self._seen, current
+        if current == seen:
+            return
+        if seen is None or current < seen or current - seen > self.log_size:
+            # First sync, the shared cache was flushed or we fell too far behind
+            self.l1.clear()
+            return
+        log_keys = [self.LOG_KEY.format(sequence) for sequence in range(seen + 1, current + 1)]
+        entries = self.l2.get_many(log_keys)
+        if len(entries) < len(log_keys):
+            # An entry expired or is still being written; drop everything to be safe
+            self.l1.clear()
+            return
+        for keys in entries.values():
+            for key in keys:
+                self.l1.delete(key)
+
+
+class _Call:
+    __slots__ = ('event', 'result', 'error')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Concurrent callers for the same key share one call.
+
+    Inside a process, followers wait for the leader's result. With `shared`
+    set, the leader also takes a short lock in the shared cache and publishes
+    its result there, so other workers wait for it instead of calling too.
+    """
+    LOCK_KEY = 'flight:lock:{}'
+    RESULT_KEY = 'flight:result:{}'
+
+    def __init__(self, alias='default', shared=True, lock_timeout=10,
+                 result_timeout=5, poll_interval=0.05):
+        self.alias = alias
+        self.shared = shared
+        self.lock_timeout = lock_timeout
+        self.result_timeout = result_timeout
+        self.poll_interval = poll_interval
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.event.wait()
+            if call.error:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = self._shared_call(key, fn) if self.shared else fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.event.set()
+
+    def _shared_call(self, key, fn):
+        l2 = caches[self.alias]
+        lock_key = self.LOCK_KEY.format(key)
+        result_key = self.RESULT_KEY.format(key)
+        try:
+            acquired = l2.add(lock_key, 1, self.lock_timeout)
+        except Exception as e:
+            logger.error(f"Single-flight lock failed for {key}: {str(e)}")
+            return fn()
+
+        if acquired:
+            try:
+                result = fn()
+                try:
+                    l2.set(result_key, result, self.result_timeout)
+                except Exception as e:
+                    # Waiting workers call fn() themselves once the lock goes
+                    logger.error(f"Single-flight publish failed for {key}: {str(e)}")
+                return result
+            finally:
+                try:
+                    l2.delete(lock_key)
+                except Exception as e:
+                    logger.error(f"Single-flight unlock failed for {key}: {str(e)}")
+
+        # Another worker is already calling; wait for its result
+        deadline = time.monotonic() + self.lock_timeout
+        while time.monotonic() < deadline:
+            time.sleep(self.poll_interval)
+            try:
+                result = l2.get(result_key, _MISSING)
+                if result is not _MISSING:
+                    return result
+                if l2.get(lock_key) is None:
+                    # The leader finished without publishing (it failed)
+                    break
+            except Exception as e:
+                logger.error(f"Single-flight wait failed for {key}: {str(e)}")
+                break
+        return fn()
+
+
+class StaleWhileRevalidate:
+    """
+    Serves the last known value and refreshes it in the background.
+
+    Entries are kept for `hard_timeout` but considered due for refresh after
+    `soft_timeout`. Each read may refresh early with a probability that rises
+    as the soft deadline nears (XFetch, scaled by how long the last load took
+    and `beta`), so entries written together don't all refresh together.
+
+    A loader returning None means "not found"; that is cached as a tombstone
+    for `negative_timeout`. Loader exceptions are never cached.
+
+    With a `codec` (see loans.records) values are stored as its bytes, and
+    entries written under another schema version count as misses.
+    """
+    def __init__(self, backend, soft_timeout, hard_timeout, beta=1.0, workers=2,
+                 negative_timeout=300, codec=None):
+        self.backend = backend
+        self.codec = codec
+        self.soft_timeout = soft_timeout
+        self.hard_timeout = max(hard_timeout, soft_timeout)
+        self.negative_timeout = negative_timeout
+        self.beta = beta
+        self.workers = workers
+        self._executor = None
+        self._refreshing = set()
+        self._lock = threading.Lock()
+
+    def get(self, key, loader):
+        entry = self.backend.get(key)
+        if entry is None:
+            return self._load(key, loader, fill=True)
+
+        value, refresh_at, delta = entry
+        if is_not_found(value):
+            value = None
+        elif self.codec:
+            try:
+                value = self.codec.loads(value)
+            except SchemaMismatch:
+                return self._load(key, loader, fill=True)
+        if time.time() - delta * self.beta * math.log(1.0 - random.random()) >= refresh_at:
+            self._refresh_in_background(key, loader)
+        return value
+
+    def set(self, key, value, delta=0.0, fill=False):
+        """
+        Stores `value`; with `fill` (after a miss) the tiered cache doesn't
+        broadcast it, since no worker can hold an older copy
+        """
+        store = self.backend.fill if fill else self.backend.set
+        if value is None:
+            entry = (NOT_FOUND, time.time() + self.negative_timeout, delta)
+            store(key, entry, self.negative_timeout)
+        else:
+            if self.codec:
+                value = self.codec.dumps(value)
+            entry = (value, time.time() + self.soft_timeout, delta)
+            store(key, entry, self.hard_timeout)
+
+    def _load(self, key, loader, fill=False):
+        start = time.time()
+        value = loader()
+        self.set(key, value, time.time() - start, fill=fill)
+        return value
+
+    def _refresh_in_background(self, key, loader):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers,
+                    thread_name_prefix='cache-refresh'
+                )
+        self._executor.submit(self._refresh, key, loader)
+
+    def _refresh(self, key, loader):
+        try:
+            # A failed refresh keeps serving the old value until hard expiry
+            self._load(key, loader)
+        except Exception as e:
+            logger.error(f"Background refresh failed for {key}: {str(e)}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+            # Loaders may read the database; don't leak this thread's connection
+            connection.close()
+
+
+cache = TieredCache()
+
+kyc_cache = StaleWhileRevalidate(
+    cache,
+    soft_timeout=settings.KYC_CACHE_SOFT_TIMEOUT,
+    hard_timeout=settings.KYC_CACHE_HARD_TIMEOUT,
+    beta=settings.KYC_CACHE_BETA,
+    negative_timeout=settings.CBS_NOT_FOUND_CACHE_TIMEOUT,
+    codec=kyc_codec
+)
+
+
+def loan_status_key(application_id):
+    return f"loan_status_{application_id}"
+
+
+def invalidate_loan_status(application_ids):
+    """
+    Drops cached LoanStatusAPI responses once the current transaction commits
+    """
+    keys = [loan_status_key(application_id) for application_id in application_ids]
+    if keys:
+        transaction.on_commit(lambda: cache.delete_many(keys))
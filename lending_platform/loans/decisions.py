@@ -0,0 +1,127 @@
+from decimal import Decimal
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+
+from .cache import cache
+from .models import DecisionRuleSet
+
+
+class RuleSet:
+    """
+    One version of the approval rules, as plain values
+    """
+    __slots__ = ('version', 'min_score', 'max_amount_ratio', 'allowed_exclusions', 'interest_rate', 'term_days')
+
+    def __init__(self, version, min_score, max_amount_ratio, allowed_exclusions, interest_rate, term_days):
+        self.version = version
+        self.min_score = min_score
+        # Two places, as DecisionRuleSet stores it, so batches compare it exactly in integers
+        self.max_amount_ratio = Decimal(str(max_amount_ratio)).quantize(Decimal('0.01'))
+        self.allowed_exclusions = tuple(allowed_exclusions)
+        self.interest_rate = Decimal(str(interest_rate))
+        self.term_days = term_days
+
+    @classmethod
+    def from_model(cls, rule_set):
+        return cls(
+            rule_set.version,
+            rule_set.min_score,
+            rule_set.max_amount_ratio,
+            rule_set.allowed_exclusions,
+            rule_set.interest_rate,
+            rule_set.term_days
+        )
+
+    @classmethod
+    def from_config(cls, config, version=0):
+        return cls(
+            version,
+            config['min_score'],
+            config['max_amount_ratio'],
+            config['allowed_exclusions'],
+            config['interest_rate'],
+            config['term_days']
+        )
+
+    def to_tuple(self):
+        return (
+            self.version, self.min_score, str(self.max_amount_ratio),
+            self.allowed_exclusions, str(self.interest_rate), self.term_days
+        )
+
+    @classmethod
+    def from_tuple(cls, values):
+        return cls(*values)
+
+
+class DecisionEngine:
+    """
+    Applies the active rule set to one application or to many at once.
+
+    The rule set is the newest active DecisionRuleSet, or LOAN_DECISION_RULES
+    when there is none. It is kept in the tiered cache and dropped whenever a
+    DecisionRuleSet changes (see loans.signals), so edits take effect in every
+    worker without a restart.
+    """
+    CACHE_KEY = 'decision_rules:active'
+
+    def __init__(self):
+        self._values = None
+        self._rule_set = None
+
+    def rule_set(self):
+        values = cache.get(self.CACHE_KEY)
+        if values is None:
+            values = self._load().to_tuple()
+            cache.fill(self.CACHE_KEY, values, settings.DECISION_RULES_CACHE_TIMEOUT)
+        # The L1 hands back the same tuple until it changes; rebuild only then
+        if values is not self._values:
+            self._rule_set, self._values = RuleSet.from_tuple(values), values
+        return self._rule_set
+
+    def reload(self):
+        # After commit: a worker reloading before then would cache the old rules
+        transaction.on_commit(lambda: cache.delete(self.CACHE_KEY))
+
+    def _load(self):
+        rule_set = DecisionRuleSet.objects.filter(is_active=True).order_by('-version').first()
+        if rule_set:
+            return RuleSet.from_model(rule_set)
+        return RuleSet.from_config(settings.LOAN_DECISION_RULES)
+
+    def decide(self, score, credit_limit, exclusion, requested_amount, rule_set=None):
+        """
+        True when one application is approved
+        """
+        rule_set = rule_set or self.rule_set()
+        return (
+            score is not None and credit_limit is not None and
+            score >= rule_set.min_score and
+            Decimal(str(requested_amount)) <= Decimal(str(credit_limit)) * rule_set.max_amount_ratio and
+            exclusion in rule_set.allowed_exclusions
+        )
+
+    def decide_batch(self, scores, credit_limits, exclusions, requested_amounts, rule_set=None):
+        """
+        Boolean array of approvals for equally long sequences of inputs.
+        Amounts, limits and the ratio are compared as int64 cents and
+        hundredths, never as floats, so results match `decide`.
+        """
+        rule_set = rule_set or self.rule_set()
+        scores = np.asarray(scores, dtype=np.float64)
+        credit_limits = np.asarray(credit_limits, dtype=np.float64)
+        has_limit = ~np.isnan(credit_limits)
+        limit_cents = np.rint(np.where(has_limit, credit_limits, 0) * 100).astype(np.int64)
+        amount_cents = np.rint(np.asarray(requested_amounts, dtype=np.float64) * 100).astype(np.int64)
+        ratio_hundredths = int(rule_set.max_amount_ratio * 100)
+        # NaN (a missing score) never compares true, so it is rejected
+        return (
+            has_limit &
+            (scores >= rule_set.min_score) &
+            (amount_cents * 100 <= limit_cents * ratio_hundredths) &
+            np.isin(np.asarray(exclusions, dtype=object), rule_set.allowed_exclusions)
+        )
+
+
+decision_engine = DecisionEngine()
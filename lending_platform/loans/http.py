@@ -0,0 +1,287 @@
+import re
+import time
+import logging
+import threading
+import requests
+from urllib.parse import urlsplit
+from requests.adapters import HTTPAdapter
+from lxml import etree
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class CallMetrics:
+    """
+    Per-dependency, per-host counters for outbound calls made by this process.
+
+    With a `log_interval`, a summary line per dependency and host is logged
+    at most that often (checked as calls are recorded), so every worker
+    reports its own counters.
+    """
+    def __init__(self, log_interval=None):
+        self._lock = threading.Lock()
+        self._stats = {}
+        self.log_interval = log_interval
+        self._next_log = time.monotonic() + (log_interval or 0)
+
+    def record(self, name, host, status_code, elapsed):
+        self._record(name, host, status_code, elapsed)
+        if not self.log_interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            due = now >= self._next_log
+            if due:
+                self._next_log = now + self.log_interval
+        if due:
+            self.log()
+
+    def log(self):
+        for key, stats in sorted(self.snapshot().items()):
+            logger.info(
+                f"Outbound {key}: {stats['calls']} calls, {stats['errors']} errors, "
+                f"avg {stats['avg_time']:.3f}s, max {stats['max_time']:.3f}s, "
+                f"status codes {stats['status_codes']}"
+            )
+
+    def _record(self, name, host, status_code, elapsed):
+        with self._lock:
+            stats = self._stats.setdefault((name, host), {
+                'calls': 0,
+                'errors': 0,
+                'total_time': 0.0,
+                'max_time': 0.0,
+                'status_codes': {},
+            })
+            stats['calls'] += 1
+            stats['total_time'] += elapsed
+            stats['max_time'] = max(stats['max_time'], elapsed)
+            if status_code is None or status_code >= 500:
+                stats['errors'] += 1
+            if status_code is not None:
+                stats['status_codes'][status_code] = stats['status_codes'].get(status_code, 0) + 1
+
+    def snapshot(self):
+        with self._lock:
+            result = {}
+            for (name, host), stats in self._stats.items():
+                result[f"{name}:{host}"] = {
+                    **stats,
+                    'status_codes': dict(stats['status_codes']),
+                    'avg_time': stats['total_time'] / stats['calls'],
+                }
+            return result
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """Raised instead of calling a dependency whose circuit is open"""
+
+
+class CircuitBreaker:
+    """
+    Closed/open/half-open breaker over a rolling window of call outcomes.
+
+    The window is split into buckets so old outcomes age out smoothly. Once
+    at least `min_calls` were made in the window and the failure rate reaches
+    `failure_rate`, the circuit opens and calls fail fast for `open_seconds`.
+    Then up to `half_open_calls` probe calls go through: a success closes the
+    circuit, a failure opens it again.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, name, window=30, buckets=10, min_calls=10,
+                 failure_rate=0.5, open_seconds=30, half_open_calls=1):
+        self.name = name
+        self.bucket_seconds = window / buckets
+        self.buckets = buckets
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.open_seconds = open_seconds
+        self.half_open_calls = half_open_calls
+        self.state = self.CLOSED
+        self._opened_at = 0
+        self._probes = 0
+        self._window = {}
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.open_seconds:
+                    return False
+                self.state = self.HALF_OPEN
+                self._probes = 0
+                logger.info(f"Circuit {self.name} half-open")
+            if self.state == self.HALF_OPEN:
+                if self._probes >= self.half_open_calls:
+                    return False
+                self._probes += 1
+            return True
+
+    def record(self, success):
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                if success:
+                    self._close()
+                else:
+                    self._open()
+                return
+
+            bucket = int(time.monotonic() / self.bucket_seconds)
+            calls, failures = self._window.get(bucket, (0, 0))
+            self._window[bucket] = (calls + 1, failures + (0 if success else 1))
+            for old in [b for b in self._window if b <= bucket - self.buckets]:
+                del self._window[old]
+
+            calls = sum(c for c, _ in self._window.values())
+            failures = sum(f for _, f in self._window.values())
+            if (self.state == self.CLOSED and calls >= self.min_calls and
+                    failures / calls >= self.failure_rate):
+                self._open()
+
+    def _open(self):
+        self.state = self.OPEN
+        self._opened_at = time.monotonic()
+        self._window.clear()
+        logger.warning(f"Circuit {self.name} open for {self.open_seconds}s")
+
+    def _close(self):
+        self.state = self.CLOSED
+        self._window.clear()
+        logger.info(f"Circuit {self.name} closed")
+
+
+def is_client_fault(response):
+    """
+    SOAP 1.1 answers every fault with HTTP 500. Faults that blame the
+    request (faultcode Client, or CBS's unknown-customer fault) come from a
+    working service and count as successes; server faults are failures.
+    """
+    if response.status_code != 500 or 'xml' not in response.headers.get('Content-Type', ''):
+        return False
+    # Fault bodies are small; reading one also works for streamed responses
+    try:
+        fault = etree.fromstring(response.content).find('.//{*}Fault')
+    except etree.XMLSyntaxError:
+        return False
+    if fault is None:
+        return False
+    code = (fault.findtext('faultcode') or '').rpartition(':')[2]
+    if code.startswith(('Client', 'Sender')):
+        return True
+    return bool(re.search(settings.CBS_NOT_FOUND_FAULT, fault.findtext('faultstring') or '', re.IGNORECASE))
+
+
+class PooledHTTPAdapter(HTTPAdapter):
+    """
+    Keep-alive connection pools that apply a default (connect, read) timeout
+    and record every call, including the ones zeep makes
+    """
+    def __init__(self, name, timeout, metrics, breaker=None, **kwargs):
+        self.name = name
+        self.default_timeout = timeout
+        self.metrics = metrics
+        self.breaker = breaker
+        super().__init__(**kwargs)
+
+    def send(self, request, timeout=None, **kwargs):
+        if self.breaker and not self.breaker.allow():
+            raise CircuitOpenError(f"Circuit {self.name} is open", request=request)
+        if timeout is None:
+            timeout = self.default_timeout
+        host = urlsplit(request.url).netloc
+        start = time.monotonic()
+        try:
+            response = super().send(request, timeout=timeout, **kwargs)
+        except Exception:
+            elapsed = time.monotonic() - start
+            self.metrics.record(self.name, host, None, elapsed)
+            if self.breaker:
+                self.breaker.record(False)
+            logger.warning(f"{self.name} {request.method} {host} failed after {elapsed:.3f}s")
+            raise
+        elapsed = time.monotonic() - start
+        self.metrics.record(self.name, host, response.status_code, elapsed)
+        if self.breaker:
+            self.breaker.record(response.status_code < 500 or is_client_fault(response))
+        logger.debug(f"{self.name} {request.method} {request.url} {response.status_code} {elapsed:.3f}s")
+        return response
+
+
+class OutboundClient:
+    """
+    One pooled requests.Session per outbound dependency ('scoring', 'cbs').
+    urllib3 keeps a separate connection pool for each host behind the session.
+    """
+    def __init__(self):
+        self._sessions = {}
+        self._breakers = {}
+        # Re-entrant: building a session looks up its breaker under the same lock
+        self._lock = threading.RLock()
+        self.metrics = CallMetrics(log_interval=settings.HTTP_METRICS_LOG_INTERVAL)
+
+    def timeout(self, name):
+        if name == 'cbs':
+            return (settings.CBS_CONNECT_TIMEOUT, settings.CBS_TIMEOUT)
+        if name == 'scoring':
+            return (settings.SCORING_CONNECT_TIMEOUT, settings.SCORING_TIMEOUT)
+        return (settings.HTTP_CONNECT_TIMEOUT, settings.HTTP_READ_TIMEOUT)
+
+    def session(self, name):
+        session = self._sessions.get(name)
+        if session is None:
+            with self._lock:
+                session = self._sessions.get(name)
+                if session is None:
+                    session = self._build(name)
+                    self._sessions[name] = session
+        return session
+
+    def breaker(self, name):
+        """
+        Every call to a dependency, whichever code makes it, shares one breaker
+        """
+        with self._lock:
+            breaker = self._breakers.get(name)
+            if breaker is None:
+                breaker = self._breakers[name] = CircuitBreaker(
+                    name,
+                    window=settings.CIRCUIT_BREAKER_WINDOW,
+                    buckets=settings.CIRCUIT_BREAKER_BUCKETS,
+                    min_calls=settings.CIRCUIT_BREAKER_MIN_CALLS,
+                    failure_rate=settings.CIRCUIT_BREAKER_FAILURE_RATE,
+                    open_seconds=settings.CIRCUIT_BREAKER_OPEN_SECONDS,
+                    half_open_calls=settings.CIRCUIT_BREAKER_HALF_OPEN_CALLS,
+                )
+            return breaker
+
+    def _build(self, name):
+        session = requests.Session()
+        adapter = PooledHTTPAdapter(
+            name,
+            self.timeout(name),
+            self.metrics,
+            breaker=self.breaker(name),
+            pool_connections=settings.HTTP_POOL_CONNECTIONS,
+            pool_maxsize=settings.HTTP_POOL_MAXSIZE,
+            pool_block=settings.HTTP_POOL_BLOCK,
+        )
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    def close(self):
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
+
+
+http_client = OutboundClient()
@@ -0,0 +1,112 @@
+import os
+import json
+from datetime import date
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from loans.backtest import Backtester
+from loans.decisions import RuleSet, decision_engine
+from loans.models import DecisionRuleSet
+
+class Command(BaseCommand):
+    help = 'Replay decided loan applications through candidate rule sets and compare approvals and exposure'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rule-version',
+            dest='versions',
+            type=int,
+            action='append',
+            default=[],
+            help='DecisionRuleSet version to evaluate (repeatable)'
+        )
+        parser.add_argument(
+            '--rules',
+            action='append',
+            default=[],
+            help='JSON file of LOAN_DECISION_RULES keys to evaluate; missing keys come from settings (repeatable)'
+        )
+        parser.add_argument(
+            '--settings-rules',
+            action='store_true',
+            help='Evaluate LOAN_DECISION_RULES from settings'
+        )
+        parser.add_argument(
+            '--since',
+            type=date.fromisoformat,
+            help='Only applications created on or after this date (YYYY-MM-DD)'
+        )
+        parser.add_argument(
+            '--until',
+            type=date.fromisoformat,
+            help='Only applications created on or before this date (YYYY-MM-DD)'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            help='Evaluating processes'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            help='Applications per evaluated chunk'
+        )
+
+    def handle(self, *args, **options):
+        candidates = self._candidates(options)
+        backtester = Backtester(
+            candidates,
+            workers=options['workers'],
+            chunk_size=options['chunk_size']
+        )
+        result = backtester.run(Backtester.applications(options['since'], options['until']))
+
+        if not result.applications:
+            self.stdout.write("No decided applications to backtest")
+            return
+
+        self.stdout.write(
+            f"{result.applications} applications, historically "
+            f"{result.approved} approved ({result.rate(result.approved):.2%}), "
+            f"exposure {result.amount(result.exposure)}"
+        )
+        self.stdout.write(
+            f"{'Candidate':<24} {'Approved':>10} {'Rate':>8} {'Δ rate':>9} "
+            f"{'Exposure':>16} {'Δ exposure':>16} {'+Approved':>10} {'-Approved':>10}"
+        )
+        for candidate in result.candidates:
+            rate = result.rate(candidate.approved)
+            self.stdout.write(
+                f"{candidate.label:<24} {candidate.approved:>10} {rate:>8.2%} "
+                f"{(rate - result.rate(result.approved)) * 100:>+8.2f}pp "
+                f"{result.amount(candidate.exposure):>16} "
+                f"{result.amount(candidate.exposure - result.exposure):>+16} "
+                f"{candidate.newly_approved:>10} {candidate.newly_rejected:>10}"
+            )
+
+    def _candidates(self, options):
+        candidates = []
+        for version in options['versions']:
+            try:
+                rule_set = DecisionRuleSet.objects.get(version=version)
+            except DecisionRuleSet.DoesNotExist:
+                raise CommandError(f"No DecisionRuleSet with version {version}")
+            candidates.append((f"v{version}", RuleSet.from_model(rule_set)))
+
+        for path in options['rules']:
+            try:
+                with open(path) as fh:
+                    config = json.load(fh)
+            except (OSError, ValueError) as e:
+                raise CommandError(f"Cannot read rules from {path}: {e}")
+            candidates.append((
+                os.path.basename(path),
+                RuleSet.from_config({**settings.LOAN_DECISION_RULES, **config})
+            ))
+
+        if options['settings_rules']:
+            candidates.append(('settings', RuleSet.from_config(settings.LOAN_DECISION_RULES)))
+
+        if not candidates:
+            rule_set = decision_engine.rule_set()
+            candidates.append((f"active (v{rule_set.version})", rule_set))
+        return candidates
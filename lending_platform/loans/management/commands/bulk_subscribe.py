@@ -0,0 +1,65 @@
+import csv
+import json
+from django.core.management.base import BaseCommand, CommandError
+from loans.bulk import BulkSubscriber
+
+class Command(BaseCommand):
+    help = 'Subscribe the customers listed in a CSV or JSONL file; writes one JSON line per customer'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            help="CSV with a customer_number column, or JSONL of {\"customer_number\": ...} objects"
+        )
+        parser.add_argument(
+            '--format',
+            choices=['csv', 'jsonl'],
+            help='Input format (default: from the file extension)'
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            help='Maximum KYC lookups in flight'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            help='Subscriptions written per upsert'
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        input_format = options['format'] or ('jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv')
+        subscriber = BulkSubscriber(
+            concurrency=options['concurrency'],
+            batch_size=options['batch_size']
+        )
+        try:
+            with open(path, newline='') as fh:
+                customer_numbers = self._read_csv(fh) if input_format == 'csv' else self._read_jsonl(fh)
+                for result in subscriber.run(customer_numbers):
+                    self.stdout.write(json.dumps(result))
+        except OSError as e:
+            raise CommandError(f"Cannot read {path}: {e}")
+
+        # Results go to stdout; keep the summary out of the way of a pipe
+        self.stderr.write(self.style.SUCCESS(
+            ", ".join(f"{count} {name.lower()}" for name, count in subscriber.counts.items())
+        ))
+
+    def _read_csv(self, fh):
+        reader = csv.DictReader(fh)
+        if not reader.fieldnames or 'customer_number' not in reader.fieldnames:
+            raise CommandError("CSV input needs a customer_number column")
+        for row in reader:
+            yield row['customer_number']
+
+    def _read_jsonl(self, fh):
+        for line_number, line in enumerate(fh, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                raise CommandError(f"Line {line_number} is not valid JSON")
+            yield record if isinstance(record, str) else record.get('customer_number')
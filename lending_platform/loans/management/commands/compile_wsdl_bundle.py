@@ -0,0 +1,27 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from loans.services import CBSService
+
+class Command(BaseCommand):
+    help = 'Fetch the CBS WSDLs and imported XSDs into a local bundle'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--output',
+            default=settings.CBS_WSDL_BUNDLE_DIR,
+            help='Directory to write the bundle to'
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"Compiling CBS WSDL bundle into {options['output']}...")
+        try:
+            manifest = CBSService.compile_wsdl_bundle(options['output'])
+        except Exception as e:
+            self.stdout.write(self.style.ERROR(
+                f"Failed to compile CBS WSDL bundle: {str(e)}"
+            ))
+            return
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Bundled {len(manifest['documents'])} documents for {len(manifest['wsdls'])} WSDLs"
+        ))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from loans.poller import ScorePoller
+
+class Command(BaseCommand):
+    help = 'Poll the Scoring Engine for every outstanding scoring token'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Exit once the currently outstanding tokens are resolved'
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            help='Maximum queryScore calls in flight'
+        )
+
+    def handle(self, *args, **options):
+        poller = ScorePoller(concurrency=options['concurrency'])
+        self.stdout.write(f"Polling scores with concurrency {poller.concurrency}...")
+        try:
+            poller.run(once=options['once'])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS("Score poller stopped"))
@@ -0,0 +1,25 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from loans.services import CBSService
+
+class Command(BaseCommand):
+    help = 'Re-download the CBS WSDL/XSD documents into the local cache (and the bundle, if there is one)'
+
+    def handle(self, *args, **options):
+        self.stdout.write("Refreshing CBS WSDL cache...")
+        try:
+            manifest = CBSService.refresh_wsdl_cache()
+        except Exception as e:
+            self.stdout.write(self.style.ERROR(
+                f"Failed to refresh CBS WSDL cache: {str(e)}"
+            ))
+            return
+
+        if manifest:
+            self.stdout.write(f"Recompiled the bundle in {settings.CBS_WSDL_BUNDLE_DIR}")
+        self.stdout.write(self.style.SUCCESS(
+            "CBS WSDL cache refreshed"
+        ))
+        self.stdout.write(self.style.WARNING(
+            "Restart the workers to load the new documents"
+        ))
@@ -4,17 +4,23 @@ from loans.models import ClientRegistration
 
 class Command(BaseCommand):
     help = 'Register this service with the Scoring Engine'
-    
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rotate',
+            action='store_true',
+            help='Register again for a new token; older tokens expire after CLIENT_TOKEN_ROTATION_OVERLAP'
+        )
 
     def handle(self, *args, **options):
-        if ClientRegistration.objects.exists():
+        if ClientRegistration.objects.exists() and not options['rotate']:
             self.stdout.write(self.style.WARNING(
                 "Client is already registered with Scoring Engine"
             ))
             return
             
         self.stdout.write("Registering client with Scoring Engine...")
-        client = ScoringService.register_client()
+        client = ScoringService.register_client(rotate=options['rotate'])
         
         if client:
             self.stdout.write(self.style.SUCCESS(
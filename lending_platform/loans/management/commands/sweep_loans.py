@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from loans.tasks import get_executor, resubmit_abandoned_loans, sweep_stale_loans
+
+class Command(BaseCommand):
+    help = 'Retry lost background decisions and fail applications stuck in PENDING or PROCESSING; run it periodically'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--timeout',
+            type=int,
+            help='Seconds without progress before an application is failed (default: LOAN_DECISION_TIMEOUT)'
+        )
+
+    def handle(self, *args, **options):
+        failed = sweep_stale_loans(options['timeout'])
+        resubmitted = resubmit_abandoned_loans()
+        # Let the resubmitted decisions finish before the process exits
+        get_executor().shutdown(wait=True)
+        self.stdout.write(self.style.SUCCESS(
+            f"Failed {failed} stuck loan applications, resubmitted {resubmitted}"
+        ))
@@ -0,0 +1,86 @@
+# Generated by Django 5.2 on 2026-10-18 09:29
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClientRegistration',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('client_id', models.IntegerField()),
+                ('url', models.URLField()),
+                ('name', models.CharField(max_length=100)),
+                ('username', models.CharField(max_length=100)),
+                ('password', models.CharField(max_length=100)),
+                ('token', models.CharField(max_length=100)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CustomerSubscription',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('customer_number', models.CharField(max_length=50, unique=True)),
+                ('is_active', models.BooleanField(default=True)),
+                ('subscribed_at', models.DateTimeField(auto_now_add=True)),
+                ('last_updated', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='LoanApplication',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('application_id', models.UUIDField(default=uuid.uuid4, editable=False, unique=True)),
+                ('customer_number', models.CharField(max_length=50)),
+                ('requested_amount', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('approved_amount', models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True)),
+                ('status', models.CharField(choices=[('PENDING', 'Pending'), ('PROCESSING', 'Processing'), ('APPROVED', 'Approved'), ('REJECTED', 'Rejected'), ('DISBURSED', 'Disbursed'), ('REPAID', 'Repaid'), ('FAILED', 'Failed')], default='PENDING', max_length=20)),
+                ('scoring_token', models.CharField(blank=True, max_length=100, null=True)),
+                ('score', models.IntegerField(blank=True, null=True)),
+                ('credit_limit', models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True)),
+                ('interest_rate', models.DecimalField(blank=True, decimal_places=2, max_digits=5, null=True)),
+                ('term_days', models.IntegerField(blank=True, null=True)),
+                ('application_date', models.DateTimeField(auto_now_add=True)),
+                ('disbursement_date', models.DateField(blank=True, null=True)),
+                ('due_date', models.DateField(blank=True, null=True)),
+                ('repayment_date', models.DateField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CustomerTransaction',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('customer_number', models.CharField(max_length=50)),
+                ('account_number', models.CharField(max_length=50)),
+                ('transaction_date', models.DateTimeField()),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('transaction_type', models.CharField(max_length=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['customer_number'], name='loans_custo_custome_438755_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='LoanRepayment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('payment_date', models.DateTimeField(auto_now_add=True)),
+                ('transaction_reference', models.CharField(max_length=100)),
+                ('loan', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='repayments', to='loans.loanapplication')),
+            ],
+        ),
+    ]
@@ -0,0 +1,156 @@
+# Generated by Django 5.2 on 2026-10-18 09:29
+
+import django.db.models.deletion
+import loans.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loans', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CustomerProfile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('customer_name', models.CharField(blank=True, default='', max_length=255)),
+                ('account_status', models.CharField(default='UNKNOWN', max_length=50)),
+                ('mobile', models.CharField(blank=True, max_length=50, null=True)),
+                ('fetched_at', models.DateTimeField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DecisionRuleSet',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveIntegerField(unique=True)),
+                ('min_score', models.IntegerField(default=500)),
+                ('max_amount_ratio', models.DecimalField(decimal_places=2, default=1, max_digits=5)),
+                ('allowed_exclusions', models.JSONField(default=loans.models.default_allowed_exclusions)),
+                ('interest_rate', models.DecimalField(decimal_places=2, default=12.5, max_digits=5)),
+                ('term_days', models.IntegerField(default=30)),
+                ('is_active', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PricingTable',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveIntegerField(unique=True)),
+                ('is_active', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PricingTier',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('product', models.CharField(default='STANDARD', max_length=50)),
+                ('min_score', models.IntegerField(default=0)),
+                ('min_amount', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('interest_rate', models.DecimalField(decimal_places=2, max_digits=5)),
+                ('term_days', models.IntegerField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TransactionSyncState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('customer_number', models.CharField(max_length=50)),
+                ('account_number', models.CharField(max_length=50)),
+                ('last_transaction_date', models.DateTimeField()),
+                ('synced_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AlterModelOptions(
+            name='clientregistration',
+            options={'ordering': ['-created_at', '-id']},
+        ),
+        migrations.AddField(
+            model_name='clientregistration',
+            name='expires_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='customertransaction',
+            name='description',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        # Nothing wrote CustomerTransaction before the CBS sync, so no
+        # existing row needs a real reference
+        migrations.AddField(
+            model_name='customertransaction',
+            name='reference',
+            field=models.CharField(default='', max_length=64),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='loanapplication',
+            name='decision_version',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='loanapplication',
+            name='exclusion',
+            field=models.CharField(blank=True, max_length=100, null=True),
+        ),
+        migrations.AddField(
+            model_name='loanapplication',
+            name='failure_reason',
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+        migrations.AddField(
+            model_name='loanapplication',
+            name='pricing_version',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='loanapplication',
+            name='product',
+            field=models.CharField(default='STANDARD', max_length=50),
+        ),
+        migrations.AddField(
+            model_name='loanapplication',
+            name='rejection_reason',
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+        migrations.AddField(
+            model_name='loanapplication',
+            name='version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='customertransaction',
+            index=models.Index(fields=['customer_number', 'transaction_date', 'id'], name='transaction_customer_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='loanapplication',
+            index=models.Index(fields=['customer_number', 'status'], name='loan_customer_status_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='customertransaction',
+            constraint=models.UniqueConstraint(fields=('customer_number', 'account_number', 'reference'), name='unique_customer_transaction'),
+        ),
+        migrations.AddField(
+            model_name='customerprofile',
+            name='subscription',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='profile', to='loans.customersubscription'),
+        ),
+        migrations.AddField(
+            model_name='pricingtier',
+            name='table',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tiers', to='loans.pricingtable'),
+        ),
+        migrations.AddConstraint(
+            model_name='transactionsyncstate',
+            constraint=models.UniqueConstraint(fields=('customer_number', 'account_number'), name='unique_transaction_sync_state'),
+        ),
+        migrations.AddConstraint(
+            model_name='pricingtier',
+            constraint=models.UniqueConstraint(fields=('table', 'product', 'min_score', 'min_amount'), name='unique_pricing_tier'),
+        ),
+    ]
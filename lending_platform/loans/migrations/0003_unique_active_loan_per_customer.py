@@ -0,0 +1,62 @@
+from django.db import migrations, models
+from django.db.models import Count, F
+from django.utils import timezone
+
+ACTIVE_LOAN_STATUSES = ['PENDING', 'PROCESSING', 'APPROVED', 'DISBURSED']
+UNFINISHED_STATUSES = ['PENDING', 'PROCESSING']
+# The application a customer keeps: the furthest along, then the oldest
+STATUS_RANK = {'DISBURSED': 0, 'APPROVED': 1, 'PROCESSING': 2, 'PENDING': 3}
+
+
+def fail_duplicate_active_loans(apps, schema_editor):
+    """
+    The old check-then-insert could give a customer several active
+    applications. Keeps one per customer and fails the other unfinished
+    ones; approved or disbursed loans are never touched, so customers with
+    more than one of those stop the migration for someone to resolve.
+    """
+    LoanApplication = apps.get_model('loans', 'LoanApplication')
+    active = LoanApplication.objects.filter(status__in=ACTIVE_LOAN_STATUSES)
+    customers = active.values('customer_number').annotate(
+        applications=Count('id')
+    ).filter(applications__gt=1).values_list('customer_number', flat=True)
+
+    duplicates = []
+    conflicts = []
+    for customer_number in customers:
+        applications = sorted(
+            active.filter(customer_number=customer_number).values_list('pk', 'status', 'created_at'),
+            key=lambda row: (STATUS_RANK[row[1]], row[2], row[0])
+        )
+        extra = applications[1:]
+        if any(status not in UNFINISHED_STATUSES for _, status, _ in extra):
+            conflicts.append(customer_number)
+        duplicates.extend(pk for pk, status, _ in extra if status in UNFINISHED_STATUSES)
+
+    if conflicts:
+        raise RuntimeError(
+            "Customers with more than one approved or disbursed loan; resolve them "
+            f"before migrating: {', '.join(sorted(conflicts))}"
+        )
+    if duplicates:
+        LoanApplication.objects.filter(pk__in=duplicates, status__in=UNFINISHED_STATUSES).update(
+            status='FAILED',
+            failure_reason="Duplicate active application",
+            version=F('version') + 1,
+            updated_at=timezone.now()
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loans', '0002_schema_updates'),
+    ]
+
+    operations = [
+        migrations.RunPython(fail_duplicate_active_loans, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='loanapplication',
+            constraint=models.UniqueConstraint(condition=models.Q(('status__in', ['PENDING', 'PROCESSING', 'APPROVED', 'DISBURSED'])), fields=('customer_number',), name='unique_active_loan_per_customer'),
+        ),
+    ]
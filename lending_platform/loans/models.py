@@ -1,7 +1,13 @@
 import uuid
-from django.db import models
+from datetime import timedelta
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import F, Q
 from django.utils import timezone
 
+from .cache import invalidate_loan_status
+from .records import CustomerKYC
+
 class Meta:
     verbose_name = "Loan Application"
     ordering = ['-application_date']
@@ -14,7 +20,70 @@ class CustomerSubscription(models.Model):
 
     def __str__(self):
         return f"{self.customer_number} - {'Active' if self.is_active else 'Inactive'}"
-    
+
+
+class CustomerProfile(models.Model):
+    """
+    The KYC details CBS last returned for a subscribed customer
+    """
+    subscription = models.OneToOneField(CustomerSubscription, on_delete=models.CASCADE, related_name='profile')
+    customer_name = models.CharField(max_length=255, blank=True, default='')
+    account_status = models.CharField(max_length=50, default='UNKNOWN')
+    mobile = models.CharField(max_length=50, null=True, blank=True)
+    fetched_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.customer_name} - {self.account_status}"
+
+    def is_fresh(self, max_age=None):
+        max_age = settings.KYC_PROFILE_MAX_AGE if max_age is None else max_age
+        return timezone.now() - self.fetched_at < timedelta(seconds=max_age)
+
+    def to_kyc(self, customer_number):
+        return CustomerKYC(customer_number, self.customer_name, self.account_status, self.mobile)
+
+# Statuses that count as the customer's one active loan
+ACTIVE_LOAN_STATUSES = ['PENDING', 'PROCESSING', 'APPROVED', 'DISBURSED']
+
+
+class LoanTransitionError(Exception):
+    pass
+
+
+class InvalidTransition(LoanTransitionError):
+    """The requested status change is not allowed from the current status"""
+
+
+class StaleTransition(LoanTransitionError):
+    """The application changed since it was read (status or version moved on)"""
+
+
+class LoanApplicationQuerySet(models.QuerySet):
+    """
+    Keeps the loan status cache in step with bulk writes, which bypass
+    the post_save signal
+    """
+    def fail_unfinished(self, reason):
+        """
+        Fails the applications that are still PENDING or PROCESSING; left
+        alone they would hold the customer's one active loan for good
+        """
+        # No ids are read to drop cached statuses: LoanStatusAPI keeps
+        # PENDING/PROCESSING for LOAN_STATUS_ACTIVE_CACHE_TIMEOUT at most
+        return self.filter(status__in=['PENDING', 'PROCESSING']).update(
+            status='FAILED',
+            failure_reason=reason,
+            version=F('version') + 1,
+            updated_at=timezone.now()
+        )
+
+    def bulk_update(self, objs, fields, batch_size=None):
+        objs = list(objs)
+        updated = super().bulk_update(objs, fields, batch_size=batch_size)
+        invalidate_loan_status([obj.application_id for obj in objs])
+        return updated
+
+
 class LoanApplication(models.Model):
     APPLICATION_STATUS = [
         ('PENDING', 'Pending'),
@@ -25,6 +94,16 @@ class LoanApplication(models.Model):
         ('REPAID', 'Repaid'),
         ('FAILED', 'Failed'),
     ]
+    ACTIVE_STATUSES = ACTIVE_LOAN_STATUSES
+    TRANSITIONS = {
+        'PENDING': ['PROCESSING', 'FAILED'],
+        'PROCESSING': ['APPROVED', 'REJECTED', 'FAILED'],
+        'APPROVED': ['DISBURSED'],
+        'DISBURSED': ['REPAID'],
+        'REJECTED': [],
+        'FAILED': [],
+        'REPAID': [],
+    }
     
     application_id = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
     customer_number = models.CharField(max_length=50)
@@ -34,6 +113,9 @@ class LoanApplication(models.Model):
     scoring_token = models.CharField(max_length=100, null=True, blank=True)
     score = models.IntegerField(null=True, blank=True)
     credit_limit = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
+    exclusion = models.CharField(max_length=100, null=True, blank=True)
+    rejection_reason = models.CharField(max_length=255, null=True, blank=True)
+    failure_reason = models.CharField(max_length=255, null=True, blank=True)
     interest_rate = models.DecimalField(max_digits=5, decimal_places=2, null=True, blank=True)
     term_days = models.IntegerField(null=True, blank=True)
     application_date = models.DateTimeField(auto_now_add=True)
@@ -42,10 +124,117 @@ class LoanApplication(models.Model):
     repayment_date = models.DateField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    version = models.PositiveIntegerField(default=0)
+    product = models.CharField(max_length=50, default='STANDARD')
+    decision_version = models.PositiveIntegerField(null=True, blank=True)  # DecisionRuleSet version that decided it
+    pricing_version = models.PositiveIntegerField(null=True, blank=True)  # PricingTable version that priced it
+
+    objects = LoanApplicationQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            # One active loan per customer, enforced by a partial unique index
+            models.UniqueConstraint(
+                fields=['customer_number'],
+                condition=Q(status__in=ACTIVE_LOAN_STATUSES),
+                name='unique_active_loan_per_customer',
+            ),
+        ]
+        indexes = [
+            # Covers the customer_number + status lookups without touching the table
+            models.Index(fields=['customer_number', 'status'], name='loan_customer_status_idx'),
+        ]
 
     def __str__(self):
         return f"{self.application_id} - {self.customer_number} - {self.status}"
 
+    def can_transition(self, new_status):
+        return new_status in self.TRANSITIONS.get(self.status, [])
+
+    def transition(self, new_status, **changes):
+        """
+        Moves the application to `new_status` and records `changes` with it.
+
+        Commits in its own short transaction and only succeeds if nobody else
+        changed the row since it was read; never call it around outbound I/O.
+        """
+        if not self.can_transition(new_status):
+            raise InvalidTransition(f"{self.status} -> {new_status}")
+        return self.save_changes(status=new_status, **changes)
+
+    def save_changes(self, **changes):
+        """
+        Versioned update of `changes` without the status check of `transition`
+        """
+        changes['updated_at'] = timezone.now()
+        with transaction.atomic():
+            updated = LoanApplication.objects.filter(
+                pk=self.pk,
+                status=self.status,
+                version=self.version
+            ).update(version=F('version') + 1, **changes)
+        if not updated:
+            raise StaleTransition(f"{self.application_id} changed concurrently")
+        invalidate_loan_status([self.application_id])
+        for field, value in changes.items():
+            setattr(self, field, value)
+        self.version += 1
+        return self
+
+def default_allowed_exclusions():
+    return ['No Exclusion']
+
+
+class DecisionRuleSet(models.Model):
+    """
+    A version of the loan approval rules; the newest active version decides
+    """
+    version = models.PositiveIntegerField(unique=True)
+    min_score = models.IntegerField(default=500)
+    max_amount_ratio = models.DecimalField(max_digits=5, decimal_places=2, default=1)  # Of the credit limit
+    allowed_exclusions = models.JSONField(default=default_allowed_exclusions)
+    interest_rate = models.DecimalField(max_digits=5, decimal_places=2, default=12.5)
+    term_days = models.IntegerField(default=30)
+    is_active = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"v{self.version} - {'Active' if self.is_active else 'Inactive'}"
+
+class PricingTable(models.Model):
+    """
+    A version of the risk-based pricing grid; the newest active version prices approvals
+    """
+    version = models.PositiveIntegerField(unique=True)
+    is_active = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"v{self.version} - {'Active' if self.is_active else 'Inactive'}"
+
+class PricingTier(models.Model):
+    """
+    Rate and term for one product from a score band and an amount band on.
+    Each band runs from its lower bound up to the next tier's bound.
+    """
+    table = models.ForeignKey(PricingTable, on_delete=models.CASCADE, related_name='tiers')
+    product = models.CharField(max_length=50, default='STANDARD')
+    min_score = models.IntegerField(default=0)
+    min_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    interest_rate = models.DecimalField(max_digits=5, decimal_places=2)
+    term_days = models.IntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['table', 'product', 'min_score', 'min_amount'],
+                name='unique_pricing_tier'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.product} score>={self.min_score} amount>={self.min_amount}: {self.interest_rate}%/{self.term_days}d"
+
 class ClientRegistration(models.Model):
     client_id = models.IntegerField()
     url = models.URLField()
@@ -54,21 +243,56 @@ class ClientRegistration(models.Model):
     password = models.CharField(max_length=100)
     token = models.CharField(max_length=100)
     created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(null=True, blank=True)  # Set on older registrations by a rotation
+
+    class Meta:
+        # Newest first: the newest usable registration is the current one
+        ordering = ['-created_at', '-id']
 
     def __str__(self):
         return f"{self.name} - {self.token}"
 class CustomerTransaction(models.Model):
     customer_number = models.CharField(max_length=50)
     account_number = models.CharField(max_length=50)
+    reference = models.CharField(max_length=64)  # CBS transaction id, or a digest of the row
     transaction_date = models.DateTimeField()
     amount = models.DecimalField(max_digits=12, decimal_places=2)
     transaction_type = models.CharField(max_length=20)  # e.g., 'CREDIT', 'DEBIT'
+    description = models.CharField(max_length=255, blank=True, default='')
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
+        constraints = [
+            # Natural key: re-syncing the same CBS history never duplicates rows
+            models.UniqueConstraint(
+                fields=['customer_number', 'account_number', 'reference'],
+                name='unique_customer_transaction',
+            ),
+        ]
         indexes = [
             models.Index(fields=['customer_number']),
+            # Keyset pagination and date ranges in (transaction_date, id) order
+            models.Index(fields=['customer_number', 'transaction_date', 'id'], name='transaction_customer_date_idx'),
+        ]
+
+
+class TransactionSyncState(models.Model):
+    """
+    High-water mark of the CBS transactions stored for one customer account
+    """
+    customer_number = models.CharField(max_length=50)
+    account_number = models.CharField(max_length=50)
+    last_transaction_date = models.DateTimeField()
+    synced_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['customer_number', 'account_number'],
+                name='unique_transaction_sync_state',
+            ),
         ]
+
 class LoanRepayment(models.Model):
     loan = models.ForeignKey(LoanApplication, on_delete=models.CASCADE, related_name='repayments')
     amount = models.DecimalField(max_digits=12, decimal_places=2)
@@ -0,0 +1,35 @@
+import base64
+from datetime import datetime
+from django.db.models import Q
+
+
+def encode_cursor(transaction_date, pk):
+    """
+    Opaque keyset cursor pointing just past the (transaction_date, id) given
+    """
+    raw = f"{transaction_date.isoformat()}|{pk}".encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    Returns (transaction_date, id); raises ValueError for anything we did not issue
+    """
+    padded = cursor + '=' * (-len(cursor) % 4)
+    try:
+        transaction_date, pk = base64.urlsafe_b64decode(padded).decode('utf-8').split('|')
+        return datetime.fromisoformat(transaction_date), int(pk)
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+def after_cursor(queryset, cursor):
+    """
+    Rows ordered after the cursor in (transaction_date, id) order; an index
+    range scan rather than an OFFSET, however deep the page
+    """
+    transaction_date, pk = cursor
+    return queryset.filter(
+        Q(transaction_date__gt=transaction_date) |
+        Q(transaction_date=transaction_date, id__gt=pk)
+    )
@@ -0,0 +1,243 @@
+import time
+import heapq
+import random
+import asyncio
+import logging
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .cache import invalidate_loan_status
+from .models import LoanApplication
+from .registration import client_registrations
+from .services import ScoringService, LoanDecisionService
+from .tasks import resubmit_abandoned_loans
+
+logger = logging.getLogger(__name__)
+
+
+class PendingScore:
+    __slots__ = ('application_id', 'token', 'attempts')
+
+    def __init__(self, application_id, token):
+        self.application_id = application_id
+        self.token = token
+        self.attempts = 0
+
+
+class ScorePoller:
+    """
+    Drives every outstanding scoring token from one event loop.
+
+    Tokens sit in a heap ordered by when they are next due. Due tokens are
+    queried concurrently (at most `concurrency` at a time), unfinished ones
+    are rescheduled with exponential backoff and full jitter, and decisions
+    are written back in batches.
+    """
+    def __init__(self, concurrency=None, batch_size=None, flush_interval=None,
+                 refresh_interval=None, base_delay=None, max_delay=None,
+                 max_attempts=None):
+        self.concurrency = concurrency or settings.SCORE_POLLER_CONCURRENCY
+        self.batch_size = batch_size or settings.SCORE_POLLER_BATCH_SIZE
+        self.flush_interval = flush_interval or settings.SCORE_POLLER_FLUSH_INTERVAL
+        self.refresh_interval = refresh_interval or settings.SCORE_POLLER_REFRESH_INTERVAL
+        self.base_delay = base_delay or settings.SCORE_POLLER_BASE_DELAY
+        self.max_delay = max_delay or settings.SCORE_POLLER_MAX_DELAY
+        self.max_attempts = max_attempts or settings.SCORE_POLLER_MAX_ATTEMPTS
+
+        self._schedule = []
+        self._sequence = itertools.count()
+        self._tracked = set()
+        self._results = []
+        self._failures = []
+        self._last_flush = time.monotonic()
+        # No async HTTP client in the stack, so blocking calls run on a
+        # pool sized to the concurrency cap and share the pooled session
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.concurrency,
+            thread_name_prefix='score-poller'
+        )
+        # Database reads and batched writes get their own thread so they
+        # never queue behind scoring calls
+        self._db_executor = ThreadPoolExecutor(
+            max_workers=1,
+            thread_name_prefix='score-poller-db'
+        )
+
+    def track(self, application_id, token, delay=0):
+        if application_id in self._tracked:
+            return
+        self._tracked.add(application_id)
+        self._push(PendingScore(application_id, token), delay)
+
+    def _push(self, pending, delay):
+        heapq.heappush(self._schedule, (time.monotonic() + delay, next(self._sequence), pending))
+
+    def backoff(self, attempts):
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempts)))
+
+    @property
+    def outstanding(self):
+        return len(self._tracked)
+
+    def run(self, once=False):
+        try:
+            return asyncio.run(self.run_async(once=once))
+        finally:
+            self._executor.shutdown(wait=True)
+            self._db_executor.shutdown(wait=True)
+
+    async def run_async(self, once=False):
+        loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(self.concurrency)
+        in_flight = set()
+        client_token = None
+        next_refresh = 0
+
+        while True:
+            now = time.monotonic()
+            if now >= next_refresh:
+                next_refresh = now + self.refresh_interval
+                try:
+                    client_token, outstanding = await loop.run_in_executor(
+                        self._db_executor, self._load_outstanding
+                    )
+                except Exception as e:
+                    # Keep polling what is tracked; the next refresh tries again
+                    logger.error(f"Score poller refresh failed: {str(e)}")
+                else:
+                    if not client_token:
+                        logger.warning("Score poller idle: scoring service not configured")
+                        if once:
+                            return
+                    for application_id, token in outstanding:
+                        self.track(application_id, token)
+
+            while self._schedule and self._schedule[0][0] <= now and client_token:
+                if semaphore.locked():
+                    break
+                _, _, pending = heapq.heappop(self._schedule)
+                await semaphore.acquire()
+                task = asyncio.create_task(self._poll(loop, pending, client_token, semaphore))
+                in_flight.add(task)
+                task.add_done_callback(in_flight.discard)
+
+            if self._should_flush():
+                await self._flush(loop)
+
+            if once and not self._schedule and not in_flight:
+                await self._flush(loop)
+                return
+
+            delay = self.flush_interval
+            if self._schedule:
+                delay = min(delay, max(0, self._schedule[0][0] - time.monotonic()))
+            await asyncio.sleep(max(delay, 0.01))
+
+    async def _poll(self, loop, pending, client_token, semaphore):
+        try:
+            pending.attempts += 1
+            score_data = await loop.run_in_executor(
+                self._executor,
+                lambda: ScoringService.query_score(pending.token, client_token, max_retries=1)
+            )
+            if score_data:
+                self._results.append((pending.application_id, score_data))
+            elif pending.attempts >= self.max_attempts:
+                self._failures.append(pending.application_id)
+            else:
+                self._push(pending, self.backoff(pending.attempts))
+        finally:
+            semaphore.release()
+
+    def _should_flush(self):
+        pending = len(self._results) + len(self._failures)
+        if not pending:
+            return False
+        return (pending >= self.batch_size or
+                time.monotonic() - self._last_flush >= self.flush_interval)
+
+    def _load_outstanding(self):
+        try:
+            # Background decisions lost to a restart would otherwise never run
+            resubmit_abandoned_loans()
+            client_token = client_registrations.current()
+            outstanding = list(LoanApplication.objects.filter(
+                status='PROCESSING',
+                scoring_token__isnull=False,
+                score__isnull=True
+            ).values_list('application_id', 'scoring_token'))
+            return client_token, outstanding
+        finally:
+            connection.close()
+
+    async def _flush(self, loop):
+        # Swap the buffers on the loop thread; only the database write is
+        # handed to the executor
+        results, self._results = self._results, []
+        failures, self._failures = self._failures, []
+        self._last_flush = time.monotonic()
+        if not results and not failures:
+            return
+        try:
+            await loop.run_in_executor(self._db_executor, self.write, results, failures)
+        except Exception as e:
+            # Put the outcomes back for the next flush; the versioned
+            # writes make writing them again safe
+            logger.error(f"Score poller write of {len(results) + len(failures)} outcomes failed: {str(e)}")
+            self._results[:0] = results
+            self._failures[:0] = failures
+            return
+        for application_id, _ in results:
+            self._tracked.discard(application_id)
+        for application_id in failures:
+            self._tracked.discard(application_id)
+
+    def write(self, results, failures):
+        try:
+            self._write(results, failures)
+        finally:
+            connection.close()
+
+    def _write(self, results, failures):
+        now = timezone.now()
+        score_data = dict(results)
+        loans = list(LoanApplication.objects.filter(
+            application_id__in=list(score_data) + failures,
+            status='PROCESSING'
+        ))
+        scored = [loan for loan in loans if loan.application_id in score_data]
+        # The whole batch is decided in one vectorised pass
+        outcomes = {
+            loan.application_id: outcome
+            for loan, outcome in zip(scored, LoanDecisionService.evaluate_batch(
+                scored, [score_data[loan.application_id] for loan in scored]
+            ))
+        }
+        decided = []
+        # One short transaction per batch; each row keeps its optimistic
+        # version check so concurrent writers are never overwritten
+        with transaction.atomic():
+            for loan in loans:
+                new_status, changes = outcomes.get(
+                    loan.application_id,
+                    ('FAILED', {'failure_reason': "Scoring service unavailable"})
+                )
+                if LoanApplication.objects.filter(
+                    pk=loan.pk,
+                    status=loan.status,
+                    version=loan.version
+                ).update(
+                    status=new_status,
+                    version=F('version') + 1,
+                    updated_at=now,
+                    **changes
+                ):
+                    decided.append(loan.application_id)
+            invalidate_loan_status(decided)
+        for loan in scored:
+            ScoringService.remember_score(loan.customer_number, score_data[loan.application_id])
+        logger.info(f"Score poller wrote {len(decided)} of {len(results) + len(failures)} outcomes")
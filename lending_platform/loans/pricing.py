@@ -0,0 +1,103 @@
+from bisect import bisect_right
+from decimal import Decimal
+from django.conf import settings
+from django.db import transaction
+
+from .cache import cache
+from .models import PricingTable
+
+
+class PricingGrid:
+    """
+    Lookup index over one version of the pricing table.
+
+    Per product, the tiers' score and amount lower bounds are kept as sorted
+    lists and every (score band, amount band) cell is filled in advance with
+    the tier covering it: the one with the highest score bound, then the
+    highest amount bound, at or below the cell. A lookup is two bisects.
+    """
+    def __init__(self, version, tiers):
+        self.version = version
+        by_product = {}
+        for product, min_score, min_amount, interest_rate, term_days in tiers:
+            by_product.setdefault(product, {})[(min_score, Decimal(min_amount))] = (
+                Decimal(interest_rate), term_days
+            )
+        self._products = {
+            product: self._index(exact) for product, exact in by_product.items()
+        }
+
+    @staticmethod
+    def _index(exact):
+        score_bounds = sorted({score for score, _ in exact})
+        amount_bounds = sorted({amount for _, amount in exact})
+        cells = []
+        for i, score in enumerate(score_bounds):
+            row = []
+            carried = None
+            for j, amount in enumerate(amount_bounds):
+                # A tier in this score band wins over any lower band
+                carried = exact.get((score, amount), carried)
+                if carried is not None:
+                    row.append(carried)
+                else:
+                    row.append(cells[i - 1][j] if i else None)
+            cells.append(row)
+        return score_bounds, amount_bounds, cells
+
+    def lookup(self, product, score, amount):
+        """
+        (interest_rate, term_days) for an application, or None when no tier covers it
+        """
+        index = self._products.get(product)
+        if index is None or score is None:
+            return None
+        score_bounds, amount_bounds, cells = index
+        i = bisect_right(score_bounds, score) - 1
+        j = bisect_right(amount_bounds, Decimal(str(amount))) - 1
+        if i < 0 or j < 0:
+            return None
+        return cells[i][j]
+
+
+class PricingEngine:
+    """
+    Serves the newest active PricingTable as a PricingGrid.
+
+    The tiers are kept in the tiered cache and dropped whenever a table or
+    tier changes (see loans.signals); each worker builds its grid once per
+    version, so pricing a decision never queries the database.
+    """
+    CACHE_KEY = 'pricing:active'
+
+    def __init__(self):
+        self._values = None
+        self._grid = None
+
+    def grid(self):
+        values = cache.get(self.CACHE_KEY)
+        if values is None:
+            values = self._load()
+            cache.fill(self.CACHE_KEY, values, settings.PRICING_CACHE_TIMEOUT)
+        if values is not self._values:
+            self._grid, self._values = PricingGrid(*values), values
+        return self._grid
+
+    def reload(self):
+        # After commit: a worker reloading before then would cache the old tiers
+        transaction.on_commit(lambda: cache.delete(self.CACHE_KEY))
+
+    def _load(self):
+        table = PricingTable.objects.filter(is_active=True).order_by('-version').first()
+        if table is None:
+            return (None, ())
+        tiers = tuple(
+            (product, min_score, str(min_amount), str(interest_rate), term_days)
+            for product, min_score, min_amount, interest_rate, term_days in table.tiers.values_list(
+                'product', 'min_score', 'min_amount', 'interest_rate', 'term_days'
+            )
+        )
+        return (table.version, tiers)
+
+
+pricing_engine = PricingEngine()
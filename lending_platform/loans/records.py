@@ -0,0 +1,102 @@
+import marshal
+from decimal import Decimal
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+
+class SchemaMismatch(ValueError):
+    """Cached bytes were written by another record schema version"""
+
+
+class CustomerKYC:
+    """
+    The KYC fields we read from a CBS getCustomerKYC response
+    """
+    VERSION = 1
+    __slots__ = ('customer_number', 'customer_name', 'account_status', 'mobile')
+
+    def __init__(self, customer_number, customer_name, account_status, mobile=None):
+        self.customer_number = customer_number
+        self.customer_name = customer_name
+        self.account_status = account_status
+        self.mobile = mobile
+
+    @classmethod
+    def from_response(cls, response):
+        return cls(
+            getattr(response, 'customerNumber', None),
+            getattr(response, 'customerName', None) or '',
+            getattr(response, 'accountStatus', None) or 'UNKNOWN',
+            getattr(response, 'mobile', None)
+        )
+
+    def to_tuple(self):
+        return (self.customer_number, self.customer_name, self.account_status, self.mobile)
+
+    @classmethod
+    def from_tuple(cls, values):
+        return cls(*values)
+
+
+class Transaction:
+    """
+    One CBS transaction, read off a streamed getCustomerTransactions response
+    """
+    __slots__ = ('id', 'account_number', 'transaction_date', 'amount', 'transaction_type', 'description')
+
+    def __init__(self, id, account_number, transaction_date, amount, transaction_type, description=''):
+        self.id = id
+        self.account_number = account_number
+        self.transaction_date = transaction_date
+        self.amount = amount
+        self.transaction_type = transaction_type
+        self.description = description
+
+    @classmethod
+    def from_fields(cls, fields):
+        """From the text of a <transaction> element's children, keyed by local name"""
+        return cls(
+            fields.get('id'),
+            fields['accountNumber'],
+            _aware(parse_datetime(fields['transactionDate'])),
+            Decimal(fields['amount']),
+            fields['transactionType'],
+            fields.get('description') or ''
+        )
+
+
+def _aware(value):
+    if timezone.is_naive(value):
+        return timezone.make_aware(value)
+    return value
+
+
+class RecordCodec:
+    """
+    Compact bytes for a record kept in the caches.
+
+    Layout: one byte of record schema version, one byte of flags (reserved,
+    always 0), then the record tuple in marshal format. Bytes written under
+    another schema version raise SchemaMismatch, which callers treat as a
+    cache miss.
+
+    marshal is only stable within one Python version, which is fine for
+    caches shared by workers of one deployment.
+    """
+    def __init__(self, record_class):
+        self.record_class = record_class
+
+    def dumps(self, value):
+        if value is None:
+            return None
+        return bytes((self.record_class.VERSION, 0)) + marshal.dumps(value.to_tuple(), 4)
+
+    def loads(self, data):
+        if data is None:
+            return None
+        if not isinstance(data, bytes) or len(data) < 2 or data[0] != self.record_class.VERSION:
+            raise SchemaMismatch(f"Not a {self.record_class.__name__} v{self.record_class.VERSION} record")
+        return self.record_class.from_tuple(marshal.loads(data[2:]))
+
+
+kyc_codec = RecordCodec(CustomerKYC)
@@ -0,0 +1,47 @@
+import time
+from django.conf import settings
+from django.db import transaction
+
+from .cache import cache
+from .models import ClientRegistration
+
+
+class RegistrationProvider:
+    """
+    Client tokens for the Scoring Engine, without a query per request.
+
+    The newest registration's token is current. After a rotation, older
+    tokens stay usable until their expires_at so scoring started under them
+    can still be queried. The token list is kept in the tiered cache and
+    dropped whenever ClientRegistration changes (see loans.signals), so every
+    worker picks a change up within the cache sync interval.
+    """
+    CACHE_KEY = 'client_registration:tokens'
+
+    def tokens(self):
+        """
+        Usable tokens, current first
+        """
+        snapshot = cache.get(self.CACHE_KEY)
+        if snapshot is None:
+            snapshot = self._load()
+            cache.fill(self.CACHE_KEY, snapshot, settings.CLIENT_REGISTRATION_CACHE_TIMEOUT)
+        now = time.time()
+        return [token for token, expires_at in snapshot if expires_at is None or expires_at > now]
+
+    def current(self):
+        tokens = self.tokens()
+        return tokens[0] if tokens else None
+
+    def invalidate(self):
+        # After commit: a worker reloading before then would cache the old tokens
+        transaction.on_commit(lambda: cache.delete(self.CACHE_KEY))
+
+    def _load(self):
+        return [
+            (token, expires_at.timestamp() if expires_at else None)
+            for token, expires_at in ClientRegistration.objects.values_list('token', 'expires_at')
+        ]
+
+
+client_registrations = RegistrationProvider()
@@ -1,11 +1,20 @@
+from django.conf import settings
 from rest_framework import serializers
 from .models import CustomerSubscription, LoanApplication, ClientRegistration
+from .pagination import decode_cursor
 
 class SubscriptionSerializer(serializers.ModelSerializer):
     class Meta:
         model = CustomerSubscription
         fields = ['customer_number', 'is_active', 'subscribed_at']
 
+class BulkSubscriptionSerializer(serializers.Serializer):
+    customer_numbers = serializers.ListField(
+        child=serializers.CharField(max_length=50),
+        allow_empty=False,
+        max_length=settings.BULK_SUBSCRIPTION_MAX_CUSTOMERS
+    )
+
 class LoanApplicationSerializer(serializers.ModelSerializer):
     class Meta:
         model = LoanApplication
@@ -14,15 +23,46 @@ class LoanApplicationSerializer(serializers.ModelSerializer):
 class LoanRequestSerializer(serializers.Serializer):
     customer_number = serializers.CharField(max_length=50)
     amount = serializers.DecimalField(max_digits=12, decimal_places=2)
+    product = serializers.CharField(max_length=50, required=False, default='STANDARD')
+
+class TransactionQuerySerializer(serializers.Serializer):
+    """
+    Query parameters of the Transaction Data API; dates are inclusive
+    """
+    start = serializers.DateField(required=False)
+    end = serializers.DateField(required=False)
+    type = serializers.CharField(max_length=20, required=False)
+    page_size = serializers.IntegerField(
+        min_value=1,
+        max_value=settings.TRANSACTION_PAGE_MAX_SIZE,
+        required=False
+    )
+    cursor = serializers.CharField(required=False)
+
+    def validate_type(self, value):
+        return value.upper()
+
+    def validate_cursor(self, value):
+        try:
+            return decode_cursor(value)
+        except ValueError:
+            raise serializers.ValidationError("Invalid cursor")
+
+    def validate(self, data):
+        if data.get('start') and data.get('end') and data['start'] > data['end']:
+            raise serializers.ValidationError("start must not be after end")
+        return data
 
 class LoanStatusSerializer(serializers.ModelSerializer):
     class Meta:
         model = LoanApplication
         fields = [
-            'application_id', 'customer_number', 'requested_amount', 
+            'application_id', 'customer_number', 'product', 'requested_amount',
             'approved_amount', 'status', 'score', 'credit_limit',
             'interest_rate', 'term_days', 'application_date',
-            'disbursement_date', 'due_date', 'repayment_date'
+            'disbursement_date', 'due_date', 'repayment_date',
+            'rejection_reason', 'failure_reason', 'decision_version',
+            'pricing_version'
         ]
 
 class ClientRegistrationSerializer(serializers.ModelSerializer):
@@ -1,47 +1,352 @@
-import requests
-from zeep import Client,Settings
 from django.conf import settings
+from django.contrib.auth import get_user_model
 from requests.auth import HTTPBasicAuth
+import re
 import uuid
 import time
-from .models import ClientRegistration
+import hashlib
+import logging
+from datetime import timedelta
+from django.db.models import Q
+from django.utils import timezone
+from lxml import etree
+from zeep.exceptions import Fault
+from .models import (
+    ClientRegistration, CustomerSubscription, CustomerProfile,
+    CustomerTransaction, TransactionSyncState
+)
+from .soap import soap_clients, WSDLBundle, post_streaming, iter_elements
+from .http import http_client
+from .cache import cache, SingleFlight
+from .registration import client_registrations
+from .decisions import decision_engine
+from .pricing import pricing_engine
+from .records import CustomerKYC, Transaction, SchemaMismatch, kyc_codec
+
+logger = logging.getLogger(__name__)
+
+cbs_flight = SingleFlight(
+    shared=settings.CBS_SINGLE_FLIGHT_SHARED,
+    lock_timeout=settings.CBS_CONNECT_TIMEOUT + settings.CBS_TIMEOUT,
+    result_timeout=settings.CBS_SINGLE_FLIGHT_RESULT_TIMEOUT
+)
+
+class CBSError(Exception):
+    """CBS could not be reached or did not give a usable answer"""
+
+
+def is_customer_not_found(fault):
+    """
+    True for the fault CBS answers unknown customers with. Server faults,
+    rejected credentials and the like are CBS errors and must never be
+    cached as "not found".
+    """
+    return bool(re.search(settings.CBS_NOT_FOUND_FAULT, fault.message or '', re.IGNORECASE))
+
 
 class CBSService:
     @staticmethod
     def get_customer_kyc(customer_number):
-        settings_zeep = Settings(strict=False, xml_huge_tree=True)
-        client = Client(settings.CBS_WSDL_KYC, settings=settings_zeep)
-        
+        """
+        CustomerKYC record, or None when CBS does not know the customer
+        """
+        # Concurrent misses for the same customer share one SOAP call; the
+        # shared result travels as compact record bytes, not zeep objects
+        return kyc_codec.loads(cbs_flight.do(
+            f"kyc_{customer_number}",
+            lambda: CBSService._fetch_customer_kyc(customer_number)
+        ))
+
+    @staticmethod
+    def stream_customer_transactions(customer_number):
+        """
+        Iterator of Transaction records read off the response as it is
+        parsed, so peak memory does not grow with the customer's history;
+        None when CBS does not know the customer
+        """
         try:
-            response = client.service.getCustomerKYC(
+            client = soap_clients.get(settings.CBS_WSDL_TRANSACTIONS)
+            response = post_streaming(
+                client,
+                'getCustomerTransactions',
                 customerNumber=customer_number,
                 username=settings.CBS_USERNAME,
                 password=settings.CBS_PASSWORD
             )
-            return response
+        except Fault as e:
+            if not is_customer_not_found(e):
+                logger.error(f"CBS getCustomerTransactions fault for {customer_number}: {e.code} {e.message}")
+                raise CBSError(e.message) from e
+            logger.info(f"CBS getCustomerTransactions fault for {customer_number}: {e.message}")
+            return None
+        except Exception as e:
+            logger.error(f"CBS getCustomerTransactions failed for {customer_number}: {str(e)}")
+            raise CBSError(str(e)) from e
+        return CBSService._iter_transactions(customer_number, response)
+
+    @staticmethod
+    def _iter_transactions(customer_number, response):
+        try:
+            for element in iter_elements(response, '{*}transaction'):
+                yield Transaction.from_fields({
+                    etree.QName(child).localname: child.text for child in element
+                })
+        except Exception as e:
+            logger.error(f"CBS transactions stream failed for {customer_number}: {str(e)}")
+            raise CBSError(str(e)) from e
+
+    @staticmethod
+    def get_stale_kyc(customer_number):
+        """
+        Last good KYC record, for use while CBS is unavailable
+        """
+        try:
+            return kyc_codec.loads(cache.l2.get(f"stale_kyc_{customer_number}"))
+        except SchemaMismatch:
+            return None
         except Exception as e:
-            print(f"Error fetching KYC: {str(e)}")
+            logger.error(f"Stale KYC lookup failed for {customer_number}: {str(e)}")
             return None
 
     @staticmethod
-    def get_customer_transactions(customer_number):
-        settings_zeep = Settings(strict=False, xml_huge_tree=True)
-        client = Client(settings.CBS_WSDL_TRANSACTIONS, settings=settings_zeep)
-        
+    def _fetch_customer_kyc(customer_number):
+        response = CBSService._call(
+            settings.CBS_WSDL_KYC,
+            'getCustomerKYC',
+            customer_number
+        )
+        if response is None:
+            return None
+        data = kyc_codec.dumps(CustomerKYC.from_response(response))
+        # Straight to the shared cache: only read during outages, never worth L1
         try:
-            response = client.service.getCustomerTransactions(
+            cache.l2.set(f"stale_kyc_{customer_number}", data, settings.CBS_STALE_CACHE_TIMEOUT)
+        except Exception as e:
+            logger.error(f"Stale KYC copy failed for {customer_number}: {str(e)}")
+        return data
+
+    @staticmethod
+    def _call(wsdl, operation, customer_number):
+        """
+        Returns the response, None when CBS reports no such customer,
+        and raises CBSError when CBS could not answer
+        """
+        try:
+            client = soap_clients.get(wsdl)
+            response = getattr(client.service, operation)(
                 customerNumber=customer_number,
                 username=settings.CBS_USERNAME,
                 password=settings.CBS_PASSWORD
             )
-            return response
+            return response or None
+        except Fault as e:
+            # CBS answers unknown customers with a SOAP fault; other faults are errors
+            if not is_customer_not_found(e):
+                logger.error(f"CBS {operation} fault for {customer_number}: {e.code} {e.message}")
+                raise CBSError(e.message) from e
+            logger.info(f"CBS {operation} fault for {customer_number}: {e.message}")
+            return None
         except Exception as e:
-            print(f"Error fetching transactions: {str(e)}")
+            logger.error(f"CBS {operation} failed for {customer_number}: {str(e)}")
+            raise CBSError(str(e)) from e
+
+    @staticmethod
+    def wsdls():
+        return [settings.CBS_WSDL_KYC, settings.CBS_WSDL_TRANSACTIONS]
+
+    @staticmethod
+    def refresh_wsdl_cache():
+        return soap_clients.refresh(CBSService.wsdls())
+
+    @staticmethod
+    def compile_wsdl_bundle(path=None):
+        return soap_clients.compile_bundle(CBSService.wsdls(), path or settings.CBS_WSDL_BUNDLE_DIR)
+
+    @staticmethod
+    def preload_clients():
+        # Only worth doing at startup when the documents are already on disk
+        if WSDLBundle.exists(settings.CBS_WSDL_BUNDLE_DIR):
+            soap_clients.preload(CBSService.wsdls())
+
+class CustomerProfileService:
+    """
+    Durable KYC tier behind the cache: a stored CustomerProfile younger than
+    KYC_PROFILE_MAX_AGE answers lookups, so CBS is only asked once it ages out
+    """
+    @staticmethod
+    def get_kyc(customer_number):
+        """
+        CustomerKYC record, or None when CBS does not know the customer;
+        raises CBSError when the profile is stale and CBS is unavailable
+        """
+        subscription = CustomerSubscription.objects.select_related('profile').filter(
+            customer_number=customer_number
+        ).first()
+        profile = getattr(subscription, 'profile', None)
+        if profile and profile.is_fresh():
+            return profile.to_kyc(customer_number)
+
+        kyc_data = CBSService.get_customer_kyc(customer_number)
+        if kyc_data and subscription:
+            CustomerProfileService.store([(subscription.pk, kyc_data)])
+        return kyc_data
+
+    @staticmethod
+    def get_stored_kyc(customer_number):
+        """
+        The stored profile whatever its age, for use while CBS is unavailable
+        """
+        profile = CustomerProfile.objects.filter(
+            subscription__customer_number=customer_number
+        ).first()
+        return profile.to_kyc(customer_number) if profile else None
+
+    @staticmethod
+    def store(entries, replace=True):
+        """
+        Writes the profiles of (subscription id, CustomerKYC) pairs in one
+        statement. Only pass replace=True for KYC fresh from CBS; otherwise
+        existing profiles are left alone so their fetched_at stays honest.
+        """
+        fetched_at = timezone.now()
+        profiles = [
+            CustomerProfile(
+                subscription_id=subscription_id,
+                customer_name=kyc_data.customer_name,
+                account_status=kyc_data.account_status,
+                mobile=kyc_data.mobile,
+                fetched_at=fetched_at
+            )
+            for subscription_id, kyc_data in entries
+        ]
+        if replace:
+            CustomerProfile.objects.bulk_create(
+                profiles,
+                update_conflicts=True,
+                unique_fields=['subscription'],
+                update_fields=['customer_name', 'account_status', 'mobile', 'fetched_at']
+            )
+        else:
+            CustomerProfile.objects.bulk_create(profiles, ignore_conflicts=True)
+
+
+class TransactionSyncService:
+    """
+    Copies CBS transaction history into CustomerTransaction.
+
+    CBS only returns a customer's full history, so each account's high-water
+    mark filters out what is already stored before anything is written.
+    Everything from TRANSACTION_SYNC_LOOKBACK before the mark on is kept,
+    so back-dated postings and reversals that arrive late are not lost;
+    the natural key drops the rows already stored.
+    """
+    @staticmethod
+    def sync(customer_number):
+        """
+        Returns the number of transactions within the lookback of the stored marks, or None
+        when CBS does not know the customer; raises CBSError when CBS is unavailable
+        """
+        # Concurrent syncs for the same customer share one CBS call
+        return cbs_flight.do(
+            f"sync_transactions_{customer_number}",
+            lambda: TransactionSyncService._sync(customer_number)
+        )
+
+    @staticmethod
+    def _sync(customer_number):
+        transactions = CBSService.stream_customer_transactions(customer_number)
+        if transactions is None:
             return None
 
+        marks = dict(TransactionSyncState.objects.filter(
+            customer_number=customer_number
+        ).values_list('account_number', 'last_transaction_date'))
+        lookback = timedelta(seconds=settings.TRANSACTION_SYNC_LOOKBACK)
+        cutoffs = {account_number: mark - lookback for account_number, mark in marks.items()}
+        batch = []
+        latest = {}
+        count = 0
+        for tx in transactions:
+            cutoff = cutoffs.get(tx.account_number)
+            if cutoff is not None and tx.transaction_date < cutoff:
+                continue
+            batch.append(TransactionSyncService._record(customer_number, tx))
+            # Late back-dated rows must never move the mark backwards
+            latest[tx.account_number] = max(
+                latest.get(tx.account_number, marks.get(tx.account_number) or tx.transaction_date),
+                tx.transaction_date
+            )
+            if len(batch) >= settings.TRANSACTION_SYNC_BATCH_SIZE:
+                count += TransactionSyncService._store(batch)
+                batch = []
+        count += TransactionSyncService._store(batch)
+
+        # Marks only move once every batch is stored; an interrupted sync
+        # is simply repeated and the natural key drops the duplicates
+        if latest:
+            TransactionSyncState.objects.bulk_create(
+                [
+                    TransactionSyncState(
+                        customer_number=customer_number,
+                        account_number=account_number,
+                        last_transaction_date=last_transaction_date
+                    )
+                    for account_number, last_transaction_date in latest.items()
+                ],
+                update_conflicts=True,
+                unique_fields=['customer_number', 'account_number'],
+                update_fields=['last_transaction_date', 'synced_at']
+            )
+        logger.info(f"Synced {count} CBS transactions for {customer_number}")
+        return count
+
+    @staticmethod
+    def _store(batch):
+        if batch:
+            CustomerTransaction.objects.bulk_create(batch, ignore_conflicts=True)
+        return len(batch)
+
+    @staticmethod
+    def _record(customer_number, tx):
+        reference = tx.id
+        if reference is None:
+            # Older CBS builds send no id; fall back to a digest of the row
+            reference = hashlib.sha256('|'.join([
+                tx.account_number, tx.transaction_date.isoformat(), str(tx.amount),
+                tx.transaction_type, tx.description
+            ]).encode('utf-8')).hexdigest()
+        return CustomerTransaction(
+            customer_number=customer_number,
+            account_number=tx.account_number,
+            reference=reference,
+            transaction_date=tx.transaction_date,
+            amount=tx.amount,
+            transaction_type=tx.transaction_type,
+            description=tx.description[:255]
+        )
+
 class ScoringService:
     @staticmethod
-    def register_client():
+    def ensure_service_user():
+        """
+        The Scoring Engine calls our transactions endpoint with the
+        credentials we register, so they must exist as a Django user
+        """
+        user, created = get_user_model().objects.get_or_create(
+            username=settings.SERVICE_USERNAME
+        )
+        if created or not user.check_password(settings.SERVICE_PASSWORD):
+            user.set_password(settings.SERVICE_PASSWORD)
+            user.save()
+        return user
+
+    @staticmethod
+    def register_client(rotate=False):
+        """
+        Registers with the Scoring Engine. With `rotate`, older registrations
+        stay usable for CLIENT_TOKEN_ROTATION_OVERLAP and then expire.
+        """
+        ScoringService.ensure_service_user()
         payload = {
             "url": f"{settings.BASE_URL}/api/v1/transactions/",
             "name": settings.SERVICE_NAME,
@@ -50,7 +355,7 @@ class ScoringService:
         }
         
         try:
-            response = requests.post(settings.SCORING_REGISTER_URL, json=payload)
+            response = http_client.session('scoring').post(settings.SCORING_REGISTER_URL, json=payload)
             if response.status_code == 200:
                 data = response.json()
                 client = ClientRegistration.objects.create(
@@ -61,6 +366,14 @@ class ScoringService:
                     password=data['password'],
                     token=data['token']
                 )
+                if rotate:
+                    ClientRegistration.objects.exclude(pk=client.pk).filter(
+                        Q(expires_at__isnull=True) | Q(expires_at__gt=timezone.now())
+                    ).update(
+                        expires_at=timezone.now() + timedelta(seconds=settings.CLIENT_TOKEN_ROTATION_OVERLAP)
+                    )
+                    # update() skips the signals that reload the token list
+                    client_registrations.invalidate()
                 return client
             return None
         except Exception as e:
@@ -70,10 +383,9 @@ class ScoringService:
     @staticmethod
     def initiate_scoring(customer_number, client_token):
         url = f"{settings.SCORING_INITIATE_URL}/{customer_number}"
-        headers = {'client-token': client_token}
         
         try:
-            response = requests.get(url, headers=headers)
+            response = ScoringService._get(url, client_token)
             if response.status_code == 200:
                 return response.json().get('token')
             return None
@@ -84,11 +396,10 @@ class ScoringService:
     @staticmethod
     def query_score(token, client_token, max_retries=5, retry_interval=10):
         url = f"{settings.SCORING_QUERY_URL}/{token}"
-        headers = {'client-token': client_token}
         
         for attempt in range(max_retries):
             try:
-                response = requests.get(url, headers=headers)
+                response = ScoringService._get(url, client_token)
                 if response.status_code == 200:
                     return response.json()
             except Exception as e:
@@ -97,4 +408,179 @@ class ScoringService:
             if attempt < max_retries - 1:
                 time.sleep(retry_interval)
         
-        return None
\ No newline at end of file
+        return None
+
+    @staticmethod
+    def recent_score(customer_number):
+        """
+        The customer's last score data if it is younger than SCORE_REUSE_TIMEOUT
+        """
+        if not settings.SCORE_REUSE_TIMEOUT:
+            return None
+        return cache.get(f"score_{customer_number}")
+
+    @staticmethod
+    def remember_score(customer_number, score_data):
+        """
+        Records score data fresh from the Scoring Engine; never pass reused
+        data back in, or the freshness window would keep extending
+        """
+        if not settings.SCORE_REUSE_TIMEOUT:
+            return
+        cache.set(
+            f"score_{customer_number}",
+            {field: score_data.get(field) for field in ('score', 'limitAmount', 'exclusion')},
+            settings.SCORE_REUSE_TIMEOUT
+        )
+
+    @staticmethod
+    def _get(url, client_token):
+        response = http_client.session('scoring').get(url, headers={'client-token': client_token})
+        if response.status_code in (401, 403):
+            # Within a rotation overlap the Scoring Engine may still expect
+            # the token a scoring request was started with
+            for previous_token in client_registrations.tokens():
+                if previous_token == client_token:
+                    continue
+                response = http_client.session('scoring').get(url, headers={'client-token': previous_token})
+                if response.status_code not in (401, 403):
+                    break
+        return response
+
+
+class LoanDecisionService:
+    """
+    Runs scoring for a loan application and applies the decision rules.
+    Each status change commits on its own; no transaction spans a scoring call.
+    """
+    @staticmethod
+    def process(loan, client_token, score_data=None):
+        """
+        Scores and decides the application; with `score_data` (a recent
+        score of the customer) the Scoring Engine is not called
+        """
+        if loan.status == 'PENDING':
+            loan.transition('PROCESSING')
+
+        if score_data:
+            logger.info(f"Reusing recent score for {loan.customer_number}")
+            return LoanDecisionService.decide(loan, score_data)
+
+        if not LoanDecisionService.initiate(loan, client_token):
+            return loan
+        scoring_token = loan.scoring_token
+
+        # Query score with retry mechanism
+        score_data = None
+        for attempt in range(settings.SCORING_MAX_RETRIES):
+            try:
+                score_data = ScoringService.query_score(
+                    scoring_token,
+                    client_token
+                )
+                if score_data:
+                    break
+            except Exception as e:
+                logger.warning(f"Scoring attempt {attempt + 1} failed: {str(e)}")
+                if attempt < settings.SCORING_MAX_RETRIES - 1:
+                    time.sleep(settings.SCORING_RETRY_DELAY)
+
+        if not score_data:
+            return LoanDecisionService.fail(loan, "Scoring service unavailable")
+
+        ScoringService.remember_score(loan.customer_number, score_data)
+        return LoanDecisionService.decide(loan, score_data)
+
+    @staticmethod
+    def initiate(loan, client_token):
+        scoring_token = ScoringService.initiate_scoring(
+            loan.customer_number,
+            client_token
+        )
+
+        if not scoring_token:
+            LoanDecisionService.fail(loan, "Could not initiate scoring")
+            return False
+
+        loan.save_changes(scoring_token=scoring_token)
+        return True
+
+    @staticmethod
+    def decide(loan, score_data):
+        new_status, changes = LoanDecisionService.evaluate(loan, score_data)
+        return loan.transition(new_status, **changes)
+
+    @staticmethod
+    def evaluate(loan, score_data):
+        """
+        Returns the decided status and the fields to record with it
+        """
+        rule_set = decision_engine.rule_set()
+        approved = decision_engine.decide(
+            score_data.get('score', 0),
+            score_data.get('limitAmount', 0),
+            score_data.get('exclusion', ''),
+            loan.requested_amount,
+            rule_set=rule_set
+        )
+        return LoanDecisionService.outcome(loan, score_data, approved, rule_set, pricing_engine.grid())
+
+    @staticmethod
+    def evaluate_batch(loans, score_data):
+        """
+        evaluate() for many applications at once; `score_data` lines up with `loans`
+        """
+        rule_set = decision_engine.rule_set()
+        approved = decision_engine.decide_batch(
+            [data.get('score', 0) for data in score_data],
+            [data.get('limitAmount', 0) for data in score_data],
+            [data.get('exclusion', '') for data in score_data],
+            [loan.requested_amount for loan in loans],
+            rule_set=rule_set
+        )
+        grid = pricing_engine.grid()
+        return [
+            LoanDecisionService.outcome(loan, data, bool(flag), rule_set, grid)
+            for loan, data, flag in zip(loans, score_data, approved)
+        ]
+
+    @staticmethod
+    def outcome(loan, score_data, approved, rule_set, grid):
+        score = score_data.get('score', 0)
+        credit_limit = score_data.get('limitAmount', 0)
+        exclusion = score_data.get('exclusion', '')
+        changes = {
+            'score': score,
+            'credit_limit': credit_limit,
+            'exclusion': exclusion,
+            'decision_version': rule_set.version,
+        }
+
+        if approved:
+            # The pricing table sets rate and term; the rule set's apply
+            # to applications no tier covers
+            price = grid.lookup(loan.product, score, loan.requested_amount)
+            if price:
+                (interest_rate, term_days), pricing_version = price, grid.version
+            else:
+                interest_rate, term_days, pricing_version = rule_set.interest_rate, rule_set.term_days, None
+            changes.update({
+                'approved_amount': loan.requested_amount,
+                'interest_rate': interest_rate,
+                'term_days': term_days,
+                'pricing_version': pricing_version,
+                'disbursement_date': timezone.now().date(),
+                'due_date': timezone.now().date() + timedelta(days=term_days),
+            })
+            return 'APPROVED', changes
+
+        changes['rejection_reason'] = (
+            f"Score: {score}, "
+            f"Limit: {credit_limit}, "
+            f"Exclusion: {exclusion}"
+        )
+        return 'REJECTED', changes
+
+    @staticmethod
+    def fail(loan, reason):
+        return loan.transition('FAILED', failure_reason=reason)
@@ -0,0 +1,44 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from .authentication import token_cache_key
+from .cache import cache, invalidate_loan_status
+from .decisions import decision_engine
+from .models import LoanApplication, ClientRegistration, DecisionRuleSet, PricingTable, PricingTier
+from .pricing import pricing_engine
+from .registration import client_registrations
+
+
+@receiver(post_save, sender=LoanApplication)
+@receiver(post_delete, sender=LoanApplication)
+def drop_cached_loan_status(sender, instance, **kwargs):
+    invalidate_loan_status([instance.application_id])
+
+
+@receiver(post_delete, sender=Token)
+def revoke_cached_token(sender, instance, **kwargs):
+    # After commit: a request before then would cache the still-existing token again
+    key = token_cache_key(instance.key)
+    transaction.on_commit(lambda: cache.delete(key))
+
+
+@receiver(post_save, sender=ClientRegistration)
+@receiver(post_delete, sender=ClientRegistration)
+def reload_client_registrations(sender, instance, **kwargs):
+    client_registrations.invalidate()
+
+
+@receiver(post_save, sender=DecisionRuleSet)
+@receiver(post_delete, sender=DecisionRuleSet)
+def reload_decision_rules(sender, instance, **kwargs):
+    decision_engine.reload()
+
+
+@receiver(post_save, sender=PricingTable)
+@receiver(post_delete, sender=PricingTable)
+@receiver(post_save, sender=PricingTier)
+@receiver(post_delete, sender=PricingTier)
+def reload_pricing(sender, instance, **kwargs):
+    pricing_engine.reload()
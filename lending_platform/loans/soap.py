@@ -0,0 +1,256 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from lxml import etree
+from zeep import Client, Settings
+from zeep.cache import Base
+from zeep.exceptions import Fault
+from zeep.transports import Transport
+from zeep.wsdl.utils import etree_to_string
+from django.conf import settings
+from .http import http_client
+
+logger = logging.getLogger(__name__)
+
+
+class WSDLFileCache(Base):
+    """
+    Keeps every WSDL/XSD document zeep loads in a local directory,
+    one file per URL, so parsing a client never needs the CBS host again
+    """
+    def __init__(self, path, timeout=None):
+        self.path = path
+        self.timeout = timeout
+        os.makedirs(path, exist_ok=True)
+
+    def _filename(self, url):
+        digest = hashlib.sha256(url.encode('utf-8')).hexdigest()
+        return os.path.join(self.path, f"{digest}.xml")
+
+    def add(self, url, content):
+        filename = self._filename(url)
+        # Write to a temp file first so other workers never read half a document
+        tmp_filename = f"{filename}.{os.getpid()}.tmp"
+        with open(tmp_filename, 'wb') as fh:
+            fh.write(content)
+        os.replace(tmp_filename, filename)
+
+    def get(self, url):
+        filename = self._filename(url)
+        try:
+            if self.timeout and time.time() - os.path.getmtime(filename) > self.timeout:
+                return None
+            with open(filename, 'rb') as fh:
+                return fh.read()
+        except FileNotFoundError:
+            return None
+
+    def clear(self):
+        for name in os.listdir(self.path):
+            if name.endswith('.xml'):
+                os.remove(os.path.join(self.path, name))
+
+
+class WSDLBundle(Base):
+    """
+    Read-only set of WSDL/XSD documents compiled by `compile_wsdl_bundle`.
+    Documents missing from the bundle are looked up in the fallback cache.
+    """
+    MANIFEST = 'manifest.json'
+
+    def __init__(self, path, fallback=None):
+        self.path = path
+        self.fallback = fallback
+        with open(os.path.join(path, self.MANIFEST)) as fh:
+            self.manifest = json.load(fh)
+        self.documents = {}
+        for url, name in self.manifest['documents'].items():
+            with open(os.path.join(path, name), 'rb') as fh:
+                self.documents[url] = fh.read()
+
+    @classmethod
+    def exists(cls, path):
+        return bool(path) and os.path.exists(os.path.join(path, cls.MANIFEST))
+
+    @classmethod
+    def write(cls, path, documents, wsdls):
+        os.makedirs(path, exist_ok=True)
+        manifest = {
+            'wsdls': list(wsdls),
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'documents': {},
+        }
+        for url, content in documents.items():
+            name = f"{hashlib.sha256(url.encode('utf-8')).hexdigest()}.xml"
+            with open(os.path.join(path, name), 'wb') as fh:
+                fh.write(content)
+            manifest['documents'][url] = name
+        with open(os.path.join(path, cls.MANIFEST), 'w') as fh:
+            json.dump(manifest, fh, indent=2)
+        return manifest
+
+    def add(self, url, content):
+        if self.fallback:
+            self.fallback.add(url, content)
+
+    def get(self, url):
+        content = self.documents.get(url)
+        if content is None:
+            logger.warning(f"{url} is not in the WSDL bundle")
+            if self.fallback:
+                return self.fallback.get(url)
+        return content
+
+
+class RecordingCache(Base):
+    """
+    Never answers from cache, so zeep fetches every document and we see each one
+    """
+    def __init__(self):
+        self.documents = {}
+
+    def add(self, url, content):
+        self.documents[url] = content
+
+    def get(self, url):
+        return None
+
+
+class SoapClientRegistry:
+    """
+    Holds one ready zeep Client per WSDL for the lifetime of the process
+    """
+    def __init__(self):
+        self._clients = {}
+        self._lock = threading.Lock()
+        self._cache = None
+
+    @property
+    def cache(self):
+        if self._cache is None:
+            file_cache = WSDLFileCache(
+                settings.CBS_WSDL_CACHE_DIR,
+                timeout=settings.CBS_WSDL_CACHE_TIMEOUT or None
+            )
+            if WSDLBundle.exists(settings.CBS_WSDL_BUNDLE_DIR):
+                self._cache = WSDLBundle(settings.CBS_WSDL_BUNDLE_DIR, fallback=file_cache)
+            else:
+                self._cache = file_cache
+        return self._cache
+
+    @property
+    def file_cache(self):
+        cache = self.cache
+        return cache.fallback if isinstance(cache, WSDLBundle) else cache
+
+    def get(self, wsdl):
+        client = self._clients.get(wsdl)
+        if client is None:
+            with self._lock:
+                client = self._clients.get(wsdl)
+                if client is None:
+                    client = self._build(wsdl)
+                    self._clients[wsdl] = client
+        return client
+
+    def _build(self, wsdl, cache=None):
+        logger.info(f"Loading SOAP client for {wsdl}")
+        settings_zeep = Settings(strict=False, xml_huge_tree=True)
+        transport = Transport(
+            cache=cache or self.cache,
+            timeout=settings.CBS_TIMEOUT,
+            operation_timeout=http_client.timeout('cbs'),
+            session=http_client.session('cbs')
+        )
+        return Client(wsdl, settings=settings_zeep, transport=transport)
+
+    def preload(self, wsdls):
+        for wsdl in wsdls:
+            self.get(wsdl)
+
+    def refresh(self, wsdls):
+        """
+        Drops cached documents and clients, then downloads the given WSDLs
+        again. A bundle is read before the file cache, so when one exists it
+        is recompiled too; returns its manifest, or None without a bundle.
+
+        Only this process's clients are rebuilt; running workers keep theirs
+        until they restart.
+        """
+        manifest = None
+        if WSDLBundle.exists(settings.CBS_WSDL_BUNDLE_DIR):
+            manifest = self.compile_bundle(wsdls, settings.CBS_WSDL_BUNDLE_DIR)
+        with self._lock:
+            self.file_cache.clear()
+            self._clients.clear()
+        self.preload(wsdls)
+        return manifest
+
+    def compile_bundle(self, wsdls, path):
+        """
+        Fetches the WSDLs and every imported document and writes them to `path`
+        """
+        recorder = RecordingCache()
+        for wsdl in wsdls:
+            self._build(wsdl, cache=recorder)
+        manifest = WSDLBundle.write(path, recorder.documents, wsdls)
+        with self._lock:
+            self._cache = None
+            self._clients.clear()
+        return manifest
+
+    def reset(self):
+        with self._lock:
+            self._clients.clear()
+
+
+def post_streaming(client, operation, **params):
+    """
+    Sends `operation` like client.service would, but returns the open
+    HTTP response instead of parsing it. Raises zeep's Fault for SOAP faults.
+    """
+    binding = client.service._binding
+    options = client.service._binding_options
+    envelope, http_headers = binding._create(operation, (), params, client=client, options=options)
+    response = client.transport.session.post(
+        options['address'],
+        data=etree_to_string(envelope),
+        headers=http_headers,
+        timeout=client.transport.operation_timeout,
+        stream=True
+    )
+    if response.status_code >= 400:
+        # Faults are small; read the body whole to report them
+        try:
+            fault = etree.fromstring(response.content).find('.//{*}Fault')
+        except etree.XMLSyntaxError:
+            fault = None
+        if fault is not None:
+            raise Fault(fault.findtext('faultstring') or 'Unknown fault', code=fault.findtext('faultcode'))
+        response.raise_for_status()
+    return response
+
+
+def iter_elements(response, tag):
+    """
+    Yields each `tag` element of a streamed response as soon as it is parsed.
+
+    Elements are cleared once the consumer moves on, so memory stays bounded
+    by one element whatever the size of the response; read what you need
+    before asking for the next one.
+    """
+    response.raw.decode_content = True
+    try:
+        for _, element in etree.iterparse(response.raw, events=('end',), tag=tag, huge_tree=True):
+            yield element
+            element.clear(keep_tail=True)
+            while element.getprevious() is not None:
+                del element.getparent()[0]
+    finally:
+        response.close()
+
+
+soap_clients = SoapClientRegistry()
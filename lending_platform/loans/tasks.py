@@ -0,0 +1,105 @@
+import logging
+from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import connection, close_old_connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import LoanApplication, LoanTransitionError
+from .registration import client_registrations
+from .services import LoanDecisionService
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.LOAN_DECISION_WORKERS,
+            thread_name_prefix='loan-decision'
+        )
+    return _executor
+
+
+def submit_loan_decision(application_id, client_token):
+    """
+    Queue scoring and decisioning once the PENDING application is committed
+    """
+    transaction.on_commit(
+        lambda: get_executor().submit(run_loan_decision, application_id, client_token)
+    )
+
+
+def run_loan_decision(application_id, client_token):
+    close_old_connections()
+    try:
+        loan = LoanApplication.objects.get(application_id=application_id)
+        if loan.status == 'PENDING':
+            loan.transition('PROCESSING')
+        elif loan.status == 'PROCESSING' and not loan.scoring_token:
+            # Abandoned before scoring started; the versioned save claims it
+            # so only one recovering worker carries on
+            loan.save_changes()
+        else:
+            return
+        if settings.SCORE_POLLING_MODE == 'poller':
+            # The score poller picks the token up and writes the decision
+            LoanDecisionService.initiate(loan, client_token)
+        else:
+            LoanDecisionService.process(loan, client_token)
+    except LoanTransitionError as e:
+        # Another worker moved the application on first
+        logger.info(f"Background decision skipped for {application_id}: {str(e)}")
+    except Exception as e:
+        logger.error(f"Background decision error for {application_id}: {str(e)}")
+        LoanApplication.objects.filter(application_id=application_id).fail_unfinished("Internal error")
+    finally:
+        # Worker threads hold their own connection; don't leak it
+        connection.close()
+
+
+def sweep_stale_loans(timeout=None):
+    """
+    Fails applications left PENDING or PROCESSING without progress for
+    `timeout` seconds, e.g. by a worker killed mid-decision
+    """
+    timeout = settings.LOAN_DECISION_TIMEOUT if timeout is None else timeout
+    failed = LoanApplication.objects.filter(
+        updated_at__lt=timezone.now() - timedelta(seconds=timeout)
+    ).fail_unfinished("Decision timed out")
+    if failed:
+        logger.warning(f"Failed {failed} loan applications stuck for over {timeout}s")
+    return failed
+
+
+def resubmit_abandoned_loans(age=None):
+    """
+    Queues the decision again for applications whose background job was
+    lost (the process restarted between the 202 and the job running):
+    PENDING ones, and PROCESSING ones that never got a scoring token.
+    Returns how many were queued.
+    """
+    age = settings.LOAN_RESUBMIT_AFTER if age is None else age
+    abandoned = LoanApplication.objects.filter(
+        updated_at__lt=timezone.now() - timedelta(seconds=age)
+    ).filter(
+        Q(status='PENDING') | Q(status='PROCESSING', scoring_token__isnull=True)
+    )
+    application_ids = [str(application_id) for application_id in abandoned.values_list('application_id', flat=True)]
+    if not application_ids:
+        return 0
+
+    client_token = client_registrations.current()
+    if not client_token:
+        abandoned.fail_unfinished("Scoring service not configured")
+        return 0
+    # Restart the clock so the next scan doesn't queue them again while they wait
+    LoanApplication.objects.filter(application_id__in=application_ids).update(updated_at=timezone.now())
+    for application_id in application_ids:
+        get_executor().submit(run_loan_decision, application_id, client_token)
+    logger.warning(f"Resubmitted {len(application_ids)} abandoned loan applications")
+    return len(application_ids)
@@ -1,3 +1,538 @@
-from django.test import TestCase
+import time
+import random
+import asyncio
+import threading
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+import requests
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import IntegrityError, OperationalError, connection, transaction
+from django.db.models import F
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.test import APIClient
+from zeep.exceptions import Fault
 
-# Create your tests here.
+from .authentication import CachedBasicAuthentication, CachedTokenAuthentication, token_cache_key
+from .cache import SingleFlight, TieredCache, cache
+from .decisions import RuleSet, decision_engine
+from .http import CircuitBreaker, is_client_fault
+from .models import CustomerTransaction, InvalidTransition, LoanApplication, StaleTransition
+from .pagination import after_cursor, decode_cursor, encode_cursor
+from .poller import ScorePoller
+from .pricing import PricingGrid
+from .records import CustomerKYC, RecordCodec, SchemaMismatch, kyc_codec
+from .services import CBSError, CBSService, LoanDecisionService
+
+
+class LoanTransitionTests(TestCase):
+    def setUp(self):
+        self.loan = LoanApplication.objects.create(
+            customer_number='CUS001',
+            requested_amount=Decimal('500.00')
+        )
+
+    def test_allowed_transition_bumps_version(self):
+        self.loan.transition('PROCESSING')
+        self.loan.refresh_from_db()
+        self.assertEqual(self.loan.status, 'PROCESSING')
+        self.assertEqual(self.loan.version, 1)
+
+    def test_transition_is_one_update(self):
+        with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks() as callbacks:
+            self.loan.transition('PROCESSING')
+        statements = [
+            query['sql'] for query in queries.captured_queries
+            if not query['sql'].startswith(('SAVEPOINT', 'RELEASE SAVEPOINT'))
+        ]
+        self.assertEqual(len(statements), 1)
+        self.assertTrue(statements[0].startswith('UPDATE'))
+        # Dropping the cached status waits for the commit
+        self.assertEqual(len(callbacks), 1)
+
+    def test_disallowed_transition(self):
+        with self.assertRaises(InvalidTransition):
+            self.loan.transition('APPROVED')
+        for status, allowed in LoanApplication.TRANSITIONS.items():
+            self.loan.status = status
+            for new_status, _ in LoanApplication.APPLICATION_STATUS:
+                self.assertEqual(self.loan.can_transition(new_status), new_status in allowed)
+
+    def test_concurrent_transition_is_stale(self):
+        other = LoanApplication.objects.get(pk=self.loan.pk)
+        self.loan.transition('PROCESSING')
+        with self.assertRaises(StaleTransition):
+            other.transition('FAILED', failure_reason="Too late")
+        self.loan.refresh_from_db()
+        self.assertEqual(self.loan.status, 'PROCESSING')
+
+    def test_fail_unfinished_leaves_decided_applications(self):
+        decided = LoanApplication.objects.create(
+            customer_number='CUS002',
+            requested_amount=Decimal('100.00'),
+            status='REJECTED'
+        )
+        failed = LoanApplication.objects.all().fail_unfinished("Internal error")
+        self.assertEqual(failed, 1)
+        self.loan.refresh_from_db()
+        decided.refresh_from_db()
+        self.assertEqual((self.loan.status, self.loan.failure_reason), ('FAILED', "Internal error"))
+        self.assertEqual(decided.status, 'REJECTED')
+
+    def test_failed_application_frees_the_customer(self):
+        LoanApplication.objects.filter(pk=self.loan.pk).fail_unfinished("Internal error")
+        LoanApplication.objects.create(customer_number='CUS001', requested_amount=Decimal('100.00'))
+
+
+class ActiveLoanConstraintTests(TestCase):
+    def test_one_active_application_per_customer(self):
+        LoanApplication.objects.create(customer_number='CUS001', requested_amount=Decimal('500.00'))
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            LoanApplication.objects.create(customer_number='CUS001', requested_amount=Decimal('100.00'))
+        # Finished applications don't count
+        LoanApplication.objects.create(customer_number='CUS002', requested_amount=Decimal('100.00'), status='REPAID')
+        LoanApplication.objects.create(customer_number='CUS002', requested_amount=Decimal('100.00'))
+
+
+class DecisionEngineTests(SimpleTestCase):
+    rule_set = RuleSet(1, 500, '0.5', ['No Exclusion', 'Review'], '11.5', 14)
+
+    def test_batch_matches_single_decisions(self):
+        rng = random.Random(7)
+        rows = [
+            (
+                rng.choice([None, 0, 499, 500, 501, 850]),
+                rng.choice([None, 0, 1000, '1000.00', Decimal('999.99'), 1000.01]),
+                rng.choice(['No Exclusion', 'Review', 'Fraud', '', None]),
+                rng.choice([Decimal('0.01'), Decimal('499.99'), Decimal('500.00'), Decimal('500.01')]),
+            )
+            for _ in range(2000)
+        ]
+        self.assertBatchMatches(rows, self.rule_set)
+
+    def test_batch_matches_at_ratio_boundaries(self):
+        # Ratios that are not binary fractions, around limit * ratio
+        rng = random.Random(11)
+        for ratio in ['0.7', '0.33', '1.1']:
+            rule_set = RuleSet(2, 500, ratio, ['No Exclusion'], '11.5', 14)
+            rows = []
+            for _ in range(2000):
+                limit = Decimal(rng.randint(1, 500000)) / 100
+                boundary = (limit * rule_set.max_amount_ratio).quantize(Decimal('0.01'))
+                amount = boundary + Decimal(rng.randint(-2, 2)) / 100
+                rows.append((600, rng.choice([limit, float(limit)]), 'No Exclusion', amount))
+            rows.append((600, Decimal('3.30'), 'No Exclusion', Decimal('2.31')))
+            self.assertBatchMatches(rows, rule_set)
+
+    def assertBatchMatches(self, rows, rule_set):
+        batch = decision_engine.decide_batch(*zip(*rows), rule_set=rule_set)
+        single = [bool(decision_engine.decide(*row, rule_set=rule_set)) for row in rows]
+        self.assertEqual([bool(flag) for flag in batch], single)
+        self.assertTrue(any(single))
+        self.assertFalse(all(single))
+
+    def test_amount_ratio_boundary(self):
+        decide = decision_engine.decide
+        self.assertTrue(decide(500, 1000, 'Review', Decimal('500.00'), rule_set=self.rule_set))
+        self.assertFalse(decide(500, 1000, 'Review', Decimal('500.01'), rule_set=self.rule_set))
+        self.assertFalse(decide(499, 1000, 'Review', Decimal('1.00'), rule_set=self.rule_set))
+
+    def test_empty_batch(self):
+        self.assertEqual(len(decision_engine.decide_batch([], [], [], [], rule_set=self.rule_set)), 0)
+
+
+class PricingGridTests(SimpleTestCase):
+    def setUp(self):
+        self.grid = PricingGrid(3, [
+            ('STANDARD', 0, '0', '20.00', 14),
+            ('STANDARD', 600, '0', '15.00', 30),
+            ('STANDARD', 600, '1000', '12.00', 60),
+            ('STANDARD', 750, '0', '10.00', 30),
+            ('SME', 500, '5000', '9.00', 90),
+        ])
+
+    def test_band_lower_bounds_are_inclusive(self):
+        self.assertEqual(self.grid.lookup('STANDARD', 600, Decimal('1000.00')), (Decimal('12.00'), 60))
+        self.assertEqual(self.grid.lookup('STANDARD', 599, Decimal('1000.00')), (Decimal('20.00'), 14))
+        self.assertEqual(self.grid.lookup('STANDARD', 600, Decimal('999.99')), (Decimal('15.00'), 30))
+
+    def test_higher_score_band_wins_over_amount_band(self):
+        # (750, 0) is more specific in score than (600, 1000)
+        self.assertEqual(self.grid.lookup('STANDARD', 800, Decimal('5000')), (Decimal('10.00'), 30))
+
+    def test_uncovered_applications(self):
+        self.assertIsNone(self.grid.lookup('SME', 700, Decimal('4999.99')))
+        self.assertIsNone(self.grid.lookup('SME', 499, Decimal('6000')))
+        self.assertIsNone(self.grid.lookup('UNKNOWN', 800, Decimal('100')))
+        self.assertIsNone(self.grid.lookup('STANDARD', None, Decimal('100')))
+        self.assertIsNone(PricingGrid(None, ()).lookup('STANDARD', 800, Decimal('100')))
+
+
+class TransactionCursorTests(TestCase):
+    def test_cursor_round_trip(self):
+        transaction_date = timezone.now().replace(microsecond=0)
+        self.assertEqual(decode_cursor(encode_cursor(transaction_date, 42)), (transaction_date, 42))
+
+    def test_invalid_cursor(self):
+        for cursor in ['', 'not-a-cursor', encode_cursor(timezone.now(), 1)[:-3]]:
+            with self.assertRaises(ValueError):
+                decode_cursor(cursor)
+
+    def test_pages_cover_every_row_once(self):
+        start = timezone.now().replace(microsecond=0)
+        # Several rows share a timestamp, so the id breaks ties
+        CustomerTransaction.objects.bulk_create([
+            CustomerTransaction(
+                customer_number='CUS001',
+                account_number='ACC1',
+                reference=str(i),
+                transaction_date=start + timedelta(days=i // 3),
+                amount=Decimal('10.00'),
+                transaction_type='CREDIT'
+            )
+            for i in range(10)
+        ])
+        transactions = CustomerTransaction.objects.filter(
+            customer_number='CUS001'
+        ).order_by('transaction_date', 'id')
+        seen = []
+        cursor = None
+        while True:
+            page = after_cursor(transactions, cursor) if cursor else transactions
+            rows = list(page[:4])
+            seen.extend(row.reference for row in rows)
+            if len(rows) < 4:
+                break
+            cursor = decode_cursor(encode_cursor(rows[-1].transaction_date, rows[-1].id))
+        self.assertEqual(seen, [str(i) for i in range(10)])
+
+
+class RecordCodecTests(SimpleTestCase):
+    def test_round_trip(self):
+        kyc = CustomerKYC('CUS001', 'Jane Doe', 'ACTIVE', '0700000000')
+        self.assertEqual(kyc_codec.loads(kyc_codec.dumps(kyc)).to_tuple(), kyc.to_tuple())
+        self.assertIsNone(kyc_codec.loads(kyc_codec.dumps(None)))
+
+    def test_other_schema_version_is_a_mismatch(self):
+        class CustomerKYCv2(CustomerKYC):
+            VERSION = 2
+            __slots__ = ()
+
+        data = RecordCodec(CustomerKYCv2).dumps(CustomerKYCv2('CUS001', 'Jane Doe', 'ACTIVE'))
+        with self.assertRaises(SchemaMismatch):
+            kyc_codec.loads(data)
+        for data in [b'', b'\x01', 'text', {'customer_number': 'CUS001'}]:
+            with self.assertRaises(SchemaMismatch):
+                kyc_codec.loads(data)
+
+
+LOCMEM_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'loans-tests',
+    }
+}
+
+
+class BrokenCache:
+    def __getattr__(self, name):
+        def fail(*args, **kwargs):
+            raise ConnectionError("cache down")
+        return fail
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class TieredCacheTests(SimpleTestCase):
+    def setUp(self):
+        caches['default'].clear()
+        # Two workers sharing one L2, syncing on every read
+        self.worker = TieredCache(sync_interval=1e-9)
+        self.other = TieredCache(sync_interval=1e-9)
+
+    def sequence(self):
+        return caches['default'].get(TieredCache.SEQUENCE_KEY, 0)
+
+    def test_read_through_fills_l1(self):
+        caches['default'].set('key', 'value', 60)
+        self.assertEqual(self.worker.get('key'), 'value')
+        caches['default'].delete('key')
+        self.assertEqual(self.worker.get('key'), 'value')
+        self.assertIsNone(self.other.get('key'))
+
+    def test_overwrite_and_delete_reach_other_workers(self):
+        self.worker.set('key', 'old', 60)
+        self.assertEqual(self.other.get('key'), 'old')
+        self.worker.set('key', 'new', 60)
+        self.assertEqual(self.other.get('key'), 'new')
+        self.worker.delete('key')
+        self.assertIsNone(self.other.get('key'))
+        self.assertEqual(self.sequence(), 3)
+
+    def test_fill_is_not_broadcast(self):
+        self.worker.get('warm-up')
+        self.other.get('warm-up')
+        self.other.set('kept', 'value', 60)
+        self.assertEqual(self.worker.get('kept'), 'value')
+        for i in range(10):
+            self.worker.fill(f"key{i}", i, 60)
+        self.assertEqual(self.sequence(), 1)
+        # Nothing was logged, so the other worker keeps its L1
+        caches['default'].delete('kept')
+        self.assertEqual(self.worker.get('kept'), 'value')
+
+    def test_falling_behind_the_log_clears_l1(self):
+        worker = TieredCache(sync_interval=1e-9, log_size=2)
+        worker.get('warm-up')
+        worker.set('key', 'value', 60)
+        caches['default'].delete('key')
+        for i in range(3):
+            self.other.delete(f"other{i}")
+        self.assertIsNone(worker.get('key'))
+
+    def test_l2_errors_are_misses(self):
+        broken = mock.patch.object(TieredCache, 'l2', new_callable=mock.PropertyMock, return_value=BrokenCache())
+        with broken, self.assertLogs('loans.cache', 'ERROR'):
+            self.assertEqual(self.worker.get('key', 'default'), 'default')
+            self.worker.set('key', 'value', 60)
+            self.worker.delete_many(['other'])
+            # The write still reached L1 until the failing sync clears it
+            self.assertIsNone(self.worker.get('key'))
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class CachedAuthenticationTests(TestCase):
+    def setUp(self):
+        caches['default'].clear()
+        cache.l1.clear()
+        self.user = get_user_model().objects.create_user('client', password='secret')
+        self.token = Token.objects.create(user=self.user)
+        self.basic = CachedBasicAuthentication()
+        self.token_auth = CachedTokenAuthentication()
+
+    def test_cached_credentials_are_reused(self):
+        self.basic.authenticate_credentials('client', 'secret')
+        self.token_auth.authenticate_credentials(self.token.key)
+        with self.assertNumQueries(2):
+            user, _ = self.basic.authenticate_credentials('client', 'secret')
+            _, auth = self.token_auth.authenticate_credentials(self.token.key)
+        self.assertEqual(user, self.user)
+        self.assertIsInstance(auth, Token)
+        self.assertEqual(auth.key, self.token.key)
+
+    def test_password_change_revokes_basic_credentials(self):
+        self.basic.authenticate_credentials('client', 'secret')
+        self.user.set_password('changed')
+        self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.basic.authenticate_credentials('client', 'secret')
+        self.basic.authenticate_credentials('client', 'changed')
+
+    def test_deactivation_revokes_both(self):
+        self.basic.authenticate_credentials('client', 'secret')
+        self.token_auth.authenticate_credentials(self.token.key)
+        self.user.is_active = False
+        self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.basic.authenticate_credentials('client', 'secret')
+        with self.assertRaises(AuthenticationFailed):
+            self.token_auth.authenticate_credentials(self.token.key)
+
+    def test_token_delete_revokes_after_commit(self):
+        key = self.token.key
+        self.token_auth.authenticate_credentials(key)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.token.delete()
+            # Still cached until the delete commits
+            self.assertIsNotNone(cache.get(token_cache_key(key)))
+        self.assertIsNone(cache.get(token_cache_key(key)))
+        with self.assertRaises(AuthenticationFailed):
+            self.token_auth.authenticate_credentials(key)
+
+
+class CBSFaultTests(SimpleTestCase):
+    def call(self, fault):
+        with mock.patch('loans.services.soap_clients') as clients:
+            clients.get.return_value.service.getCustomerKYC.side_effect = fault
+            return CBSService._call('kyc.wsdl', 'getCustomerKYC', 'CUS001')
+
+    def test_unknown_customer_is_none(self):
+        with self.assertLogs('loans.services', 'INFO'):
+            self.assertIsNone(self.call(Fault('Customer not found', code='soapenv:Server')))
+
+    def test_other_faults_are_errors(self):
+        for fault in [
+            Fault('Internal error', code='soapenv:Server'),
+            Fault('Invalid username or password', code='soapenv:Client'),
+        ]:
+            with self.assertRaises(CBSError), self.assertLogs('loans.services', 'ERROR'):
+                self.call(fault)
+
+
+def soap_response(status_code, body, content_type='text/xml; charset=utf-8'):
+    response = requests.Response()
+    response.status_code = status_code
+    response.headers['Content-Type'] = content_type
+    response._content = body.encode('utf-8')
+    return response
+
+
+def soap_fault(code, message):
+    return soap_response(500, (
+        '<soapenv:Envelope xmlns:soapenv="http://schemas.xmlsoap.org/soap/envelope/"><soapenv:Body>'
+        f'<soapenv:Fault><faultcode>{code}</faultcode><faultstring>{message}</faultstring></soapenv:Fault>'
+        '</soapenv:Body></soapenv:Envelope>'
+    ))
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    def setUp(self):
+        self.breaker = CircuitBreaker('test', window=30, buckets=10, min_calls=4,
+                                      failure_rate=0.5, open_seconds=30, half_open_calls=1)
+
+    def test_opens_at_the_failure_rate(self):
+        for success in [True, False, True]:
+            self.breaker.record(success)
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+        with self.assertLogs('loans.http', 'WARNING'):
+            self.breaker.record(False)
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        self.assertFalse(self.breaker.allow())
+
+    def test_half_open_probe(self):
+        with self.assertLogs('loans.http', 'INFO'):
+            for _ in range(4):
+                self.breaker.record(False)
+            with mock.patch('loans.http.time.monotonic', return_value=time.monotonic() + 31):
+                self.assertTrue(self.breaker.allow())
+                self.assertFalse(self.breaker.allow())
+                self.breaker.record(False)
+                self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+            with mock.patch('loans.http.time.monotonic', return_value=time.monotonic() + 62):
+                self.assertTrue(self.breaker.allow())
+                self.breaker.record(True)
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+        self.assertTrue(self.breaker.allow())
+
+    def test_only_client_faults_are_successes(self):
+        self.assertTrue(is_client_fault(soap_fault('soapenv:Server', 'Customer not found')))
+        self.assertTrue(is_client_fault(soap_fault('soapenv:Client', 'Invalid customer number')))
+        self.assertFalse(is_client_fault(soap_fault('soapenv:Server', 'Internal error')))
+        self.assertFalse(is_client_fault(soap_response(500, 'not xml', 'text/html')))
+        self.assertFalse(is_client_fault(soap_response(503, '<Fault/>')))
+
+
+@override_settings(CACHES=LOCMEM_CACHES, LOAN_DECISION_MODE='sync')
+class LoanRequestAPITests(TestCase):
+    def setUp(self):
+        caches['default'].clear()
+        cache.l1.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(get_user_model().objects.create_user('client'))
+
+    def test_reports_a_decision_the_poller_made_first(self):
+        def decided_elsewhere(loan, client_token, score_data=None):
+            loan.transition('PROCESSING', scoring_token='token')
+            # The score poller writes its decision before ours
+            LoanApplication.objects.filter(pk=loan.pk).update(status='APPROVED', version=F('version') + 1)
+            return LoanDecisionService.decide(loan, {'score': 700, 'limitAmount': 1000, 'exclusion': 'No Exclusion'})
+
+        with mock.patch('loans.views.client_registrations.current', return_value='client-token'), \
+                mock.patch('loans.views.LoanDecisionService.process', side_effect=decided_elsewhere):
+            response = self.client.post('/api/v1/loans/request/', {'customer_number': 'CUS001', 'amount': '500.00'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['status'], 'APPROVED')
+
+
+class ScorePollerTests(SimpleTestCase):
+    def setUp(self):
+        self.poller = ScorePoller(refresh_interval=0.01, flush_interval=0.01)
+        self.addCleanup(self.poller._executor.shutdown)
+        self.addCleanup(self.poller._db_executor.shutdown)
+
+    def flush(self):
+        async def flush():
+            await self.poller._flush(asyncio.get_running_loop())
+        asyncio.run(flush())
+
+    def test_failed_write_keeps_the_batch(self):
+        self.poller.track('app-1', 'token-1')
+        self.poller.track('app-2', 'token-2')
+        self.poller._results = [('app-1', {'score': 700})]
+        self.poller._failures = ['app-2']
+        with mock.patch.object(self.poller, 'write', side_effect=[OperationalError("db down"), None]) as write:
+            with self.assertLogs('loans.poller', 'ERROR'):
+                self.flush()
+            self.assertEqual(self.poller.outstanding, 2)
+            self.flush()
+        self.assertEqual(write.call_args_list[0], write.call_args_list[1])
+        self.assertEqual(write.call_args.args, ([('app-1', {'score': 700})], ['app-2']))
+        self.assertEqual(self.poller.outstanding, 0)
+
+    def test_failed_refresh_keeps_polling(self):
+        with mock.patch.object(self.poller, '_load_outstanding', side_effect=OperationalError("db down")) as load:
+            with self.assertLogs('loans.poller', 'ERROR'), self.assertRaises(asyncio.TimeoutError):
+                asyncio.run(asyncio.wait_for(self.poller.run_async(), 0.2))
+        self.assertGreater(load.call_count, 1)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class SingleFlightTests(SimpleTestCase):
+    def setUp(self):
+        caches['default'].clear()
+
+    def test_concurrent_callers_share_one_call(self):
+        flight = SingleFlight(shared=False)
+        started, release = threading.Event(), threading.Event()
+        calls = []
+
+        def fn():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return 'result'
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(flight.do('key', fn))) for _ in range(5)]
+        threads[0].start()
+        started.wait(5)
+        for thread in threads[1:]:
+            thread.start()
+        time.sleep(0.05)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(results, ['result'] * 5)
+        self.assertEqual(len(calls), 1)
+
+    def test_errors_are_not_shared_afterwards(self):
+        flight = SingleFlight(shared=False)
+        with self.assertRaises(CBSError):
+            flight.do('key', mock.Mock(side_effect=CBSError("down")))
+        self.assertEqual(flight.do('key', lambda: 'result'), 'result')
+
+    def test_waits_for_another_workers_result(self):
+        flight = SingleFlight(poll_interval=0.01, lock_timeout=1)
+        caches['default'].add(SingleFlight.LOCK_KEY.format('key'), 1, 10)
+        caches['default'].set(SingleFlight.RESULT_KEY.format('key'), 'published', 10)
+        fn = mock.Mock(return_value='own')
+        self.assertEqual(flight.do('key', fn), 'published')
+        fn.assert_not_called()
+
+    def test_shared_cache_errors_keep_the_result(self):
+        flight = SingleFlight(poll_interval=0.01, lock_timeout=1)
+        l2 = caches['default']
+        for failing in ['set', 'delete']:
+            with mock.patch.object(l2, failing, side_effect=ConnectionError("cache down")), \
+                    self.assertLogs('loans.cache', 'ERROR'):
+                self.assertEqual(flight.do(f"key-{failing}", lambda: 'result'), 'result')
+
+        # A follower whose reads fail calls fn() itself
+        l2.add(SingleFlight.LOCK_KEY.format('key'), 1, 10)
+        with mock.patch.object(l2, 'get', side_effect=ConnectionError("cache down")), \
+                self.assertLogs('loans.cache', 'ERROR'):
+            self.assertEqual(flight.do('key', lambda: 'own'), 'own')
@@ -1,24 +1,34 @@
 import uuid
-import time
 import logging
+from datetime import datetime, time, timedelta
+from django.conf import settings
 from django.utils import timezone
-from datetime import timedelta
-from django.db import transaction
-from django.core.cache import cache
+from django.db import transaction, IntegrityError
 
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.permissions import IsAuthenticated
 
-from .models import CustomerSubscription, LoanApplication, ClientRegistration
+from .models import CustomerSubscription, LoanApplication, CustomerTransaction, StaleTransition
 from .serializers import (
+    BulkSubscriptionSerializer,
     LoanRequestSerializer,
     LoanStatusSerializer,
-    SubscriptionSerializer
+    SubscriptionSerializer,
+    TransactionQuerySerializer
 )
-from .services import CBSService, ScoringService
-from django.http import HttpResponse
+from .services import (
+    CBSService, CBSError, CustomerProfileService, LoanDecisionService, ScoringService,
+    TransactionSyncService
+)
+from .tasks import submit_loan_decision
+from .bulk import BulkSubscriber
+from .registration import client_registrations
+from .cache import cache, kyc_cache, loan_status_key, NOT_FOUND, is_not_found
+from .pagination import encode_cursor, after_cursor
+from django.http import HttpResponse, StreamingHttpResponse
+from rest_framework.utils.encoders import JSONEncoder
 
 def home_view(request):
     return HttpResponse("Welcome to the Lending Platform API!")
@@ -39,19 +49,27 @@ class SubscriptionAPI(APIView):
         customer_number = serializer.validated_data['customer_number']
         
         try:
-            # Check cache first
-            cache_key = f"kyc_{customer_number}"
-            kyc_data = cache.get(cache_key)
-            
-            if not kyc_data:
-                kyc_data = CBSService.get_customer_kyc(customer_number)
+            # Check cache first; entries past their soft TTL are served
+            # while a background refresh fetches them again
+            stale = False
+            try:
+                kyc_data = kyc_cache.get(
+                    f"kyc_{customer_number}",
+                    lambda: CustomerProfileService.get_kyc(customer_number)
+                )
+            except CBSError:
+                # CBS is down or its circuit is open: fall back to the last good copy
+                kyc_data = (CBSService.get_stale_kyc(customer_number) or
+                            CustomerProfileService.get_stored_kyc(customer_number))
                 if not kyc_data:
-                    return Response(
-                        {"error": "Customer not found in CBS"},
-                        status=status.HTTP_404_NOT_FOUND
-                    )
-                # Cache for 1 hour
-                cache.set(cache_key, kyc_data, 3600)
+                    raise
+                stale = True
+
+            if not kyc_data:
+                return Response(
+                    {"error": "Customer not found in CBS"},
+                    status=status.HTTP_404_NOT_FOUND
+                )
 
             # Atomic transaction for subscription creation
             with transaction.atomic():
@@ -59,24 +77,34 @@ class SubscriptionAPI(APIView):
                     customer_number=customer_number,
                     defaults={'is_active': True}
                 )
+                if created:
+                    # The KYC may have come from the cache, so never overwrite a profile here
+                    CustomerProfileService.store([(subscription.pk, kyc_data)], replace=False)
 
                 active_loans = LoanApplication.objects.filter(
                     customer_number=customer_number,
-                    status__in=['PENDING', 'PROCESSING', 'APPROVED', 'DISBURSED']
+                    status__in=LoanApplication.ACTIVE_STATUSES
                 ).exists()
 
             response_data = {
                 "status": "SUCCESS",
                 "message": "Customer subscribed successfully",
                 "customerDetails": {
-                    "name": getattr(kyc_data, 'customerName', ''),
-                    "accountStatus": getattr(kyc_data, 'accountStatus', 'UNKNOWN'),
+                    "name": kyc_data.customer_name,
+                    "accountStatus": kyc_data.account_status,
                     "existingLoan": active_loans
                 }
             }
+            if stale:
+                response_data['stale'] = True
             
             return Response(response_data, status=status.HTTP_200_OK)
 
+        except CBSError:
+            return Response(
+                {"error": "Core banking system unavailable"},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE
+            )
         except Exception as e:
             logger.error(f"Subscription error for {customer_number}: {str(e)}")
             return Response(
@@ -85,6 +113,28 @@ class SubscriptionAPI(APIView):
             )
 
 
+class BulkSubscriptionAPI(APIView):
+    """
+    Subscribes a list of customers; streams one JSON line per customer
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        serializer = BulkSubscriptionSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(
+                {"error": serializer.errors},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        results = BulkSubscriber().run(serializer.validated_data['customer_numbers'])
+        encoder = JSONEncoder()
+        return StreamingHttpResponse(
+            (encoder.encode(result) + '\n' for result in results),
+            content_type='application/x-ndjson'
+        )
+
+
 class LoanRequestAPI(APIView):
     """
     Handles loan applications with scoring integration
@@ -101,123 +151,98 @@ class LoanRequestAPI(APIView):
 
         customer_number = serializer.validated_data['customer_number']
         amount = serializer.validated_data['amount']
+        product = serializer.validated_data['product']
+        loan = None
         
         try:
-            with transaction.atomic():
-                # Check for active loans
-                if LoanApplication.objects.filter(
-                    customer_number=customer_number,
-                    status__in=['PENDING', 'PROCESSING', 'APPROVED', 'DISBURSED']
-                ).exists():
-                    return Response(
-                        {"error": "Customer has an active loan application"},
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
+            # Each state change below commits on its own, so scoring calls
+            # never run inside a transaction
 
-                # Create loan application
-                application_id = str(uuid.uuid4())
-                loan = LoanApplication.objects.create(
-                    application_id=application_id,
-                    customer_number=customer_number,
-                    requested_amount=amount,
-                    status='PROCESSING'
+            # Create loan application; the unique_active_loan_per_customer
+            # index rejects it if the customer already has an active loan
+            application_id = str(uuid.uuid4())
+            try:
+                with transaction.atomic():
+                    loan = LoanApplication.objects.create(
+                        application_id=application_id,
+                        customer_number=customer_number,
+                        requested_amount=amount,
+                        product=product,
+                        status='PENDING'
+                    )
+            except IntegrityError:
+                return Response(
+                    {"error": "Customer has an active loan application"},
+                    status=status.HTTP_400_BAD_REQUEST
                 )
 
-                # Get client registration
-                client_reg = ClientRegistration.objects.first()
-                if not client_reg:
-                    loan.status = 'FAILED'
-                    loan.save()
+            # A customer scored moments ago (say, a rejected application)
+            # is decided from that score without the Scoring Engine
+            score_data = ScoringService.recent_score(customer_number)
+            client_token = None
+            if not score_data:
+                # Current Scoring Engine client token, held in memory
+                client_token = client_registrations.current()
+                if not client_token:
+                    LoanDecisionService.fail(loan, "Scoring service not configured")
                     return Response(
                         {"error": "Scoring service not configured"},
                         status=status.HTTP_503_SERVICE_UNAVAILABLE
                     )
 
-                # Initiate scoring
-                scoring_token = ScoringService.initiate_scoring(
-                    customer_number, 
-                    client_reg.token
+            if settings.LOAN_DECISION_MODE == 'async' and not score_data:
+                # Scoring and decisioning finish in the background;
+                # clients follow up through LoanStatusAPI
+                submit_loan_decision(application_id, client_token)
+                return Response(
+                    {
+                        "status": loan.status,
+                        "message": "Loan application received",
+                        "applicationId": application_id,
+                        "timestamp": timezone.now().isoformat()
+                    },
+                    status=status.HTTP_202_ACCEPTED
                 )
-                
-                if not scoring_token:
-                    loan.status = 'FAILED'
-                    loan.save()
+
+            try:
+                loan = LoanDecisionService.process(loan, client_token, score_data=score_data)
+            except StaleTransition:
+                # The score poller decided it while we were polling; report
+                # what it committed
+                loan.refresh_from_db()
+
+            if loan.status == 'FAILED':
+                if not loan.scoring_token:
                     return Response(
-                        {"error": "Could not initiate scoring"},
+                        {"error": loan.failure_reason},
                         status=status.HTTP_502_BAD_GATEWAY
                     )
+                return Response(
+                    {
+                        "status": "FAILED",
+                        "message": loan.failure_reason,
+                        "applicationId": application_id
+                    },
+                    status=status.HTTP_200_OK
+                )
 
-                loan.scoring_token = scoring_token
-                loan.save()
-
-                # Query score with retry mechanism
-                max_retries = 3
-                retry_delay = 2  # seconds
-                score_data = None
-                
-                for attempt in range(max_retries):
-                    try:
-                        score_data = ScoringService.query_score(
-                            scoring_token, 
-                            client_reg.token
-                        )
-                        if score_data:
-                            break
-                    except Exception as e:
-                        logger.warning(f"Scoring attempt {attempt + 1} failed: {str(e)}")
-                        if attempt == max_retries - 1:
-                            loan.status = 'FAILED'
-                            loan.save()
-                            return Response(
-                                {
-                                    "status": "FAILED",
-                                    "message": "Scoring service unavailable",
-                                    "applicationId": application_id
-                                },
-                                status=status.HTTP_200_OK
-                            )
-                        time.sleep(retry_delay)
-
-                # Process scoring results
-                if score_data:
-                    loan.score = score_data.get('score', 0)
-                    loan.credit_limit = score_data.get('limitAmount', 0)
-                    loan.exclusion = score_data.get('exclusion', '')
-                    
-                    # Loan decision logic
-                    if (loan.score >= 500 and 
-                        amount <= loan.credit_limit and
-                        loan.exclusion == 'No Exclusion'):
-                        loan.status = 'APPROVED'
-                        loan.approved_amount = amount
-                        loan.interest_rate = 12.5  # Example rate
-                        loan.term_days = 30
-                        loan.disbursement_date = timezone.now().date()
-                        loan.due_date = timezone.now().date() + timedelta(days=30)
-                    else:
-                        loan.status = 'REJECTED'
-                        loan.rejection_reason = (
-                            f"Score: {loan.score}, " 
-                            f"Limit: {loan.credit_limit}, "
-                            f"Exclusion: {loan.exclusion}"
-                        )
-                    
-                    loan.save()
-
-                response_data = {
-                    "status": loan.status,
-                    "message": "Loan application processed",
-                    "applicationId": application_id,
-                    "timestamp": timezone.now().isoformat()
-                }
-                
-                if loan.status == 'REJECTED':
-                    response_data['reason'] = loan.rejection_reason
+            response_data = {
+                "status": loan.status,
+                "message": "Loan application processed",
+                "applicationId": application_id,
+                "timestamp": timezone.now().isoformat()
+            }
+            
+            if loan.status == 'REJECTED':
+                response_data['reason'] = loan.rejection_reason
 
-                return Response(response_data, status=status.HTTP_200_OK)
+            return Response(response_data, status=status.HTTP_200_OK)
 
         except Exception as e:
             logger.error(f"Loan request error: {str(e)}")
+            if loan is not None:
+                # Don't leave the application holding the customer's active loan
+                LoanApplication.objects.filter(pk=loan.pk).fail_unfinished("Internal error")
             return Response(
                 {"error": "Internal server error"},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
@@ -231,15 +256,21 @@ class LoanStatusAPI(APIView):
     def get(self, request, application_id):
         try:
             # Check cache first
-            cache_key = f"loan_status_{application_id}"
+            cache_key = loan_status_key(application_id)
             loan_data = cache.get(cache_key)
             
             if not loan_data:
                 loan = LoanApplication.objects.get(application_id=application_id)
                 serializer = LoanStatusSerializer(loan)
                 loan_data = serializer.data
-                # Cache for 5 minutes
-                cache.set(cache_key, loan_data, 300)
+                # Every change drops this entry, but one committed between our
+                # read and this write would be masked until expiry; only
+                # statuses that can't change again are kept long
+                if loan.TRANSITIONS[loan.status]:
+                    timeout = settings.LOAN_STATUS_ACTIVE_CACHE_TIMEOUT
+                else:
+                    timeout = settings.LOAN_STATUS_CACHE_TIMEOUT
+                cache.fill(cache_key, loan_data, timeout)
             
             return Response(loan_data, status=status.HTTP_200_OK)
             
@@ -258,44 +289,130 @@ class LoanStatusAPI(APIView):
 
 class TransactionDataAPI(APIView):
     """
-    Provides transaction data to Scoring Engine
+    Provides transaction data to Scoring Engine.
+
+    Optional query parameters: start/end (inclusive dates), type, and
+    page_size/cursor for keyset pages. Without page_size or cursor the
+    whole matching range is streamed.
     """
     permission_classes = [IsAuthenticated]
+    FIELDS = ('id', 'account_number', 'reference', 'transaction_date', 'amount', 'transaction_type', 'description')
     
     def get(self, request, customer_number):
+        query = TransactionQuerySerializer(data=request.query_params)
+        if not query.is_valid():
+            return Response(
+                {"error": query.errors},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        params = query.validated_data
+
         try:
-            # Check cache first
-            cache_key = f"transactions_{customer_number}"
-            transactions = cache.get(cache_key)
-            
-            if not transactions:
-                transactions = CBSService.get_customer_transactions(customer_number)
-                if not transactions:
-                    return Response(
-                        {"error": "No transactions found"},
-                        status=status.HTTP_404_NOT_FOUND
-                    )
-                # Cache for 1 hour
-                cache.set(cache_key, transactions, 3600)
-            
-            # Convert SOAP response to JSON
-            transaction_list = []
-            if hasattr(transactions, 'transaction'):
-                for tx in transactions.transaction:
-                    tx_data = {
-                        field: getattr(tx, field, None) 
-                        for field in tx.__dict__['__values__']
-                    }
-                    transaction_list.append(tx_data)
-            
-            return Response({
-                "customerNumber": customer_number,
-                "transactions": transaction_list
-            }, status=status.HTTP_200_OK)
+            # Pull new CBS transactions into the database at most once per interval
+            sync_key = f"transactions_synced_{customer_number}"
+            synced = cache.get(sync_key)
+            stale = False
+
+            if not synced:
+                try:
+                    stored = TransactionSyncService.sync(customer_number)
+                except CBSError:
+                    # CBS is down or its circuit is open: answer from what is already stored
+                    stale = True
+                else:
+                    if stored is None:
+                        # Remember the miss briefly so retries don't all reach CBS
+                        synced = NOT_FOUND
+                        cache.fill(sync_key, NOT_FOUND, settings.CBS_NOT_FOUND_CACHE_TIMEOUT)
+                    else:
+                        cache.fill(sync_key, True, settings.TRANSACTION_SYNC_INTERVAL)
+
+            if is_not_found(synced):
+                return Response(
+                    {"error": "No transactions found"},
+                    status=status.HTTP_404_NOT_FOUND
+                )
+
+            if stale and not CustomerTransaction.objects.filter(customer_number=customer_number).exists():
+                raise CBSError("No stored transactions to fall back on")
+
+            transactions = self._filter(customer_number, params)
+            header = {"customerNumber": customer_number}
+            if stale:
+                header['stale'] = True
+
+            if 'page_size' in params or 'cursor' in params:
+                return Response(self._page(transactions, params, header), status=status.HTTP_200_OK)
+
+            # Whole range: stream it rather than build the body in memory
+            return StreamingHttpResponse(
+                self._stream(transactions, header),
+                content_type='application/json'
+            )
             
+        except CBSError:
+            return Response(
+                {"error": "Core banking system unavailable"},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE
+            )
         except Exception as e:
             logger.error(f"Transaction data error: {str(e)}")
             return Response(
                 {"error": "Internal server error"},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
-            )
\ No newline at end of file
+            )
+
+    def _filter(self, customer_number, params):
+        transactions = CustomerTransaction.objects.filter(customer_number=customer_number)
+        if 'start' in params:
+            transactions = transactions.filter(
+                transaction_date__gte=timezone.make_aware(datetime.combine(params['start'], time.min))
+            )
+        if 'end' in params:
+            transactions = transactions.filter(
+                transaction_date__lt=timezone.make_aware(datetime.combine(params['end'] + timedelta(days=1), time.min))
+            )
+        if 'type' in params:
+            transactions = transactions.filter(transaction_type=params['type'])
+        return transactions.order_by('transaction_date', 'id').values_list(*self.FIELDS)
+
+    def _page(self, transactions, params, header):
+        page_size = params.get('page_size', settings.TRANSACTION_PAGE_SIZE)
+        if 'cursor' in params:
+            transactions = after_cursor(transactions, params['cursor'])
+        # One extra row tells us whether another page follows
+        rows = list(transactions[:page_size + 1])
+        next_cursor = None
+        if len(rows) > page_size:
+            rows = rows[:page_size]
+            next_cursor = encode_cursor(rows[-1][3], rows[-1][0])
+        return {
+            **header,
+            "transactions": [self._transaction_data(row) for row in rows],
+            "nextCursor": next_cursor
+        }
+
+    def _stream(self, transactions, header):
+        encoder = JSONEncoder()
+        yield encoder.encode(header)[:-1] + ', "transactions": ['
+        chunk = []
+        separator = ''
+        for row in transactions.iterator(chunk_size=settings.TRANSACTION_STREAM_CHUNK_SIZE):
+            chunk.append(separator + encoder.encode(self._transaction_data(row)))
+            separator = ','
+            if len(chunk) >= settings.TRANSACTION_STREAM_CHUNK_SIZE:
+                yield ''.join(chunk)
+                chunk = []
+        yield ''.join(chunk) + ']}'
+
+    @staticmethod
+    def _transaction_data(row):
+        _, account_number, reference, transaction_date, amount, transaction_type, description = row
+        return {
+            "accountNumber": account_number,
+            "reference": reference,
+            "transactionDate": transaction_date,
+            "amount": amount,
+            "transactionType": transaction_type,
+            "description": description,
+        }